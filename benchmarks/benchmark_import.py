@@ -0,0 +1,103 @@
+"""Measures how long it takes to import the reporters in a fresh Python
+interpreter, which matters for short lived jobs, and which heavy modules
+are imported. The results are printed as JSON:
+
+```
+python benchmarks/benchmark_import.py > results.json
+```
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+MODULES = [
+	'progressreporting.TelegramProgressReporter',
+	'progressreporting.AsyncTelegramProgressReporter',
+	'progressreporting.ProgressSinks',
+	'progressreporting.ProgressMetrics',
+]
+HEAVY_MODULES = ['requests', 'urllib3', 'humanize', 'multiprocessing', 'asyncio']
+
+_MEASURE = '''
+import sys, time, json
+already_imported = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy_modules': [m for m in {heavy_modules!r} if m in sys.modules and m not in already_imported]}}))
+'''
+
+def _environment(**variables):
+	"""The environment for the fresh interpreters, so they import this
+	version of `progressreporting`."""
+	environment = dict(os.environ, **variables)
+	environment['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), environment.get('PYTHONPATH', '')])
+	return environment
+
+def measure(module:str, repeat:int):
+	"""Import `module` in `repeat` fresh interpreters.
+	
+	Returns
+	-------
+	results: dict
+		The fastest and median import times, in milliseconds, and the
+		heavy modules that were imported with it.
+	"""
+	times = []
+	for _ in range(repeat):
+		output = subprocess.run(
+			[sys.executable, '-c', _MEASURE.format(module=module, heavy_modules=HEAVY_MODULES)],
+			env = _environment(),
+			capture_output = True,
+			text = True,
+			check = True,
+		)
+		result = json.loads(output.stdout)
+		times.append(result['seconds'])
+	times.sort()
+	return {
+		'best_ms': times[0]*1e3,
+		'median_ms': times[len(times)//2]*1e3,
+		'heavy_modules': result['heavy_modules'],
+	}
+
+def measure_disabled_loop(n_iterations:int):
+	"""Time per iteration, in nanoseconds, of a loop reported with
+	`PROGRESSREPORTING_DISABLED` set, including creating the reporter."""
+	code = f'''
+import time, json
+start = time.perf_counter()
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+reporter = SafeTelegramReporter4Loops(bot_token='benchmark', chat_id=1)
+with reporter.report_loop({n_iterations}, 'Benchmark disabled'):
+	for n in range({n_iterations}):
+		reporter.update(1)
+print(json.dumps(time.perf_counter() - start))
+'''
+	output = subprocess.run([sys.executable, '-c', code], env=_environment(PROGRESSREPORTING_DISABLED='1'), capture_output=True, text=True, check=True)
+	return json.loads(output.stdout)/n_iterations*1e9
+
+def run(repeat:int=11):
+	return {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'import': {module: measure(module, repeat) for module in MODULES},
+		'disabled_loop_ns_per_iteration': measure_disabled_loop(1_000_000),
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+	parser.add_argument('--repeat', type=int, default=11, help='Number of fresh interpreters for each measurement.')
+	parser.add_argument('--output', help='Write the JSON here instead of the standard output.')
+	args = parser.parse_args()
+	
+	results = run(repeat=args.repeat)
+	if args.output is None:
+		json.dump(results, sys.stdout, indent='\t')
+		print()
+	else:
+		with open(args.output, 'w') as ofile:
+			json.dump(results, ofile, indent='\t')
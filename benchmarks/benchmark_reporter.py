@@ -0,0 +1,173 @@
+"""Measures what `SafeTelegramReporter4Loops` costs, against a local
+`FakeTelegramServer` or no transport at all, so no bot nor network 
+access is needed. The results
+are printed as JSON so they can be stored and compared across releases:
+
+```
+python benchmarks/benchmark_reporter.py > results.json
+python benchmarks/benchmark_reporter.py --quick
+```
+"""
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops, RequestsTransport, TelegramRateLimiter, RetryPolicy, _flush_retry_sender
+from progressreporting.FakeTelegramServer import FakeTelegramServer
+
+NETWORKS = {
+	'fast': dict(),
+	'slow': dict(latency_seconds=.5),
+	'failing': dict(error_rate=.5),
+	'flooded': dict(too_many_requests_rate=.3, retry_after_seconds=1),
+}
+
+class NoOpTransport:
+	"""A transport that delivers nothing and answers immediately, so only 
+	the reporter is measured."""
+	def __init__(self):
+		self._message_ids = itertools.count(1)
+	
+	def send_message(self, bot_token:str, **parameters):
+		return {'ok': True, 'result': {'message_id': next(self._message_ids)}}
+	
+	def edit_message(self, bot_token:str, **parameters):
+		return {'ok': True, 'result': {}}
+
+def create_reporter(transport, send_in_background:bool=False):
+	return SafeTelegramReporter4Loops(
+		bot_token = 'benchmark',
+		chat_id = 1,
+		transport = transport,
+		rate_limiter = TelegramRateLimiter(messages_per_minute_per_chat=6000, burst_per_chat=100, messages_per_second_per_bot=100), # Measure the reporter, not the limits of Telegram.
+		send_in_background = send_in_background,
+		flush_timeout_seconds = 5,
+		retry_policy = RetryPolicy(max_attempts=3, initial_delay_seconds=.1, maximum_delay_seconds=.5),
+	)
+
+def best_of(function, repeat:int):
+	"""Runs `function`, which returns the time it measured, `repeat` times
+	and returns the minimum, which is the least affected by whatever else
+	the machine is doing."""
+	return min(function() for _ in range(repeat))
+
+def benchmark_hot_path(n_iterations:int, repeat:int):
+	"""Cost of `update` and `track` per iteration in a loop that does
+	nothing else, i.e. the worst case for the reporter. Only the loop
+	itself is timed, the starting and final messages are left out and
+	go to a `NoOpTransport`.
+	
+	Returns
+	-------
+	results: dict
+		Nanoseconds per iteration for the bare loop, and the overhead
+		added on top of it by `update` and by `track`.
+	"""
+	reporter = create_reporter(NoOpTransport())
+	
+	def bare_loop():
+		start = time.perf_counter()
+		for n in range(n_iterations):
+			pass
+		return time.perf_counter() - start
+	
+	def update_loop():
+		with reporter.report_loop(n_iterations, 'Benchmark update', miminum_update_time_seconds=60):
+			start = time.perf_counter()
+			for n in range(n_iterations):
+				reporter.update(1)
+			return time.perf_counter() - start
+	
+	def track_loop():
+		iterations = reporter.track(range(n_iterations), loop_name='Benchmark track', miminum_update_time_seconds=60)
+		next(iterations) # This is where it enters `report_loop`.
+		start = time.perf_counter()
+		for n in iterations:
+			pass
+		return time.perf_counter() - start
+	
+	bare = best_of(bare_loop, repeat)/n_iterations
+	return {
+		'n_iterations': n_iterations,
+		'bare_loop_ns_per_iteration': bare*1e9,
+		'update_overhead_ns_per_iteration': (best_of(update_loop, repeat)/n_iterations - bare)*1e9,
+		'track_overhead_ns_per_iteration': (best_of(track_loop, repeat)/n_iterations - bare)*1e9,
+	}
+
+def benchmark_network(server:FakeTelegramServer, send_in_background:bool, n_iterations:int, iteration_seconds:float, update_seconds:float):
+	"""Runs a loop that takes `n_iterations*iteration_seconds` and reports
+	it every `update_seconds`, to see how much the network slows it down.
+	
+	Returns
+	-------
+	results: dict
+		The `slowdown` is the time taken by the loop, including entering
+		and exiting `report_loop`, divided by the time it takes without
+		reporting. `requests_per_loop` are the requests received by the
+		server, including retries.
+	"""
+	reporter = create_reporter(RequestsTransport(api_url=server.api_url), send_in_background=send_in_background)
+	server.reset_counters()
+	longest_update = 0
+	start = time.perf_counter()
+	with reporter.report_loop(n_iterations, 'Benchmark network', miminum_update_time_seconds=update_seconds, check_every=1):
+		for n in range(n_iterations):
+			time.sleep(iteration_seconds)
+			update_start = time.perf_counter()
+			reporter.update(1)
+			longest_update = max(longest_update, time.perf_counter()-update_start)
+	elapsed = time.perf_counter() - start
+	_flush_retry_sender() # Without a background sender the retries continue after the loop, count them here and not in the next one.
+	ideal = n_iterations*iteration_seconds
+	return {
+		'send_in_background': send_in_background,
+		'elapsed_seconds': elapsed,
+		'ideal_seconds': ideal,
+		'slowdown': elapsed/ideal,
+		'longest_update_seconds': longest_update,
+		'requests_per_loop': server.total_requests,
+		'requests_count': server.requests_count,
+		'responses_count': {str(status): n for status,n in server.responses_count.items()},
+	}
+
+def run(quick:bool=False):
+	results = {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'time': time.time(),
+	}
+	results['hot_path'] = benchmark_hot_path(
+		n_iterations = 100_000 if quick else 1_000_000,
+		repeat = 3 if quick else 7,
+	)
+	results['network'] = {}
+	for network_name, network_options in NETWORKS.items():
+		results['network'][network_name] = []
+		with FakeTelegramServer(**network_options) as server:
+			for send_in_background in [False, True]:
+				results['network'][network_name].append(
+					benchmark_network(
+						server,
+						send_in_background = send_in_background,
+						n_iterations = 100 if quick else 300,
+						iteration_seconds = .01,
+						update_seconds = .2,
+					)
+				)
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+	parser.add_argument('--quick', action='store_true', help='Fewer and shorter loops, for a fast sanity check.')
+	parser.add_argument('--output', help='Write the JSON here instead of the standard output.')
+	args = parser.parse_args()
+	
+	results = run(quick=args.quick)
+	if args.output is None:
+		json.dump(results, sys.stdout, indent='\t')
+		print()
+	else:
+		with open(args.output, 'w') as ofile:
+			json.dump(results, ofile, indent='\t')
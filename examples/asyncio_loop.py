@@ -0,0 +1,21 @@
+from progressreporting.AsyncTelegramProgressReporter import AsyncSafeTelegramReporter4Loops
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+import asyncio
+
+N_ITERATIONS = 999
+TOTAL_LOOP_TIME = 33 # Seconds
+
+async def main():
+	reporter = AsyncSafeTelegramReporter4Loops(
+		bot_token = my_telegram_bots.robobot.token,
+		chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+	)
+	async with reporter.report_loop(N_ITERATIONS, 'A loop inside an event loop', 20):
+		for n in range(N_ITERATIONS):
+			await asyncio.sleep(TOTAL_LOOP_TIME/N_ITERATIONS) # Here you would await some stuff, I will just sleep.
+			await reporter.update(1) # This never waits for Telegram, the messages are sent in a background task.
+	
+	async for n in reporter.track(range(N_ITERATIONS), loop_name='The same, without calling update'):
+		await asyncio.sleep(TOTAL_LOOP_TIME/N_ITERATIONS)
+
+asyncio.run(main())
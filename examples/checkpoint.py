@@ -0,0 +1,16 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops, LoopCheckpoint
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+)
+
+# Stop this script (e.g. with Ctrl+C) and run it again: the loop continues from where it was, in the same message.
+n_iterations = 999
+checkpoint = LoopCheckpoint('a_long_loop.checkpoint', minimum_save_time_seconds=5)
+with reporter.report_loop(n_iterations, 'A loop that survives restarts', 20, checkpoint=checkpoint):
+	for n in range(reporter.completed_iterations, n_iterations):
+		sleep(99/n_iterations) # Here you would do some stuff, I will just sleep.
+		reporter.update(1)
@@ -0,0 +1,22 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+)
+
+# Extra fields are shown in the default message, one per line:
+with reporter.report_loop(99, 'Training', miminum_update_time_seconds=10):
+	for epoch in range(99):
+		sleep(.3) # Here you would train your model, I will just sleep.
+		reporter.set_fields(loss=1/(epoch+1), learning_rate=1e-3)
+		reporter.update(1)
+
+# Or write your own message, using any of the fields listed in `report_loop`:
+with reporter.report_loop(99, 'Training', miminum_update_time_seconds=10, message_template='🏋️ {title}\n{progress}\n{rate:.2f} epochs/s | loss {loss:.4f}\nDone at {expected_finish_time} ({remaining_time})'):
+	for epoch in range(99):
+		sleep(.3)
+		reporter.set_fields(loss=1/(epoch+1))
+		reporter.update(1)
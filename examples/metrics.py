@@ -0,0 +1,14 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+from progressreporting.ProgressMetrics import MetricsServer, MetricsSnapshots
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+)
+
+# While this runs, the loop can be monitored at http://127.0.0.1:9464/metrics (e.g. by Prometheus) and in `metrics.jsonl`.
+with MetricsServer(port=9464), MetricsSnapshots('metrics.jsonl', interval_seconds=10):
+	for n in reporter.track(range(999), loop_name='A monitored loop', miminum_update_time_seconds=20):
+		sleep(33/999) # Here you would do some stuff, I will just sleep.
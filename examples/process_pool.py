@@ -0,0 +1,24 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops, SharedLoopCounter
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from concurrent.futures import ProcessPoolExecutor
+from time import sleep
+
+N_WORKERS = 8
+N_TASKS = 99
+N_ITERATIONS_PER_TASK = 1111
+
+def do_something(task_number):
+	counter = SharedLoopCounter.attached() # This is the counter given to the pool as `initializer`.
+	for n in range(N_ITERATIONS_PER_TASK):
+		sleep(.001) # Here you would do some stuff, I will just sleep.
+		counter.update(1) # This only writes into shared memory, so it is very cheap.
+
+if __name__ == '__main__':
+	reporter = SafeTelegramReporter4Loops(
+		bot_token = my_telegram_bots.robobot.token,
+		chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+	)
+	counter = SharedLoopCounter(n_workers=N_WORKERS)
+	with reporter.report_shared_loop(counter, N_TASKS*N_ITERATIONS_PER_TASK, 'A loop done by many processes', 20):
+		with ProcessPoolExecutor(N_WORKERS, initializer=counter.attach) as executor:
+			list(executor.map(do_something, range(N_TASKS)))
@@ -0,0 +1,21 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+from progressreporting.ProgressSinks import FileSink, StdoutSink, TelegramSink
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+	sinks = [
+		FileSink('loops_log.jsonl'), # Everything, at full resolution, in a local file.
+		StdoutSink(minimum_update_time_seconds=5), # A line in the terminal every 5 seconds.
+		TelegramSink( # A short summary every 10 minutes in another chat, e.g. a group.
+			bot_token = my_telegram_bots.robobot.token,
+			chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+			minimum_update_time_seconds = 10*60,
+		),
+	],
+)
+
+for n in reporter.track(range(999), loop_name='A loop reported in many places', miminum_update_time_seconds=20):
+	sleep(33/999) # Here you would do some stuff, I will just sleep.
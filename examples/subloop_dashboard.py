@@ -0,0 +1,26 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+import numpy
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+)
+
+# With `in_parent_message=True` the subloops don't send messages of their own, they are all shown in the message of the main loop.
+n_iterations = 9
+subloop_time = 33 # seconds
+with reporter.report_loop(n_iterations,'Main loop',20):
+	for n1 in range(n_iterations):
+		n_subiterations = numpy.random.randint(low=111,high=222)
+		with reporter.report_subloop(n_subiterations,f'Subloop number {n1}',20,in_parent_message=True) as subloop_reporter:
+			for n2 in range(n_subiterations):
+				with subloop_reporter.report_subloop(3,'Sub-subloop',20,in_parent_message=True) as subsubloop_reporter:
+					for n3 in range(3):
+						sleep(subloop_time/n_subiterations/3)
+						subsubloop_reporter.update(1)
+				if n2 == int(n_subiterations/2):
+					subloop_reporter.warn(f'n2 = {n2}!') # It goes to the main loop, together with the warnings of the other subloops.
+				subloop_reporter.update(1)
+		reporter.update(1)
@@ -0,0 +1,21 @@
+from progressreporting.TelegramProgressReporter import ThreadSafeTelegramReporter4Loops
+from concurrent.futures import ThreadPoolExecutor
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+import random
+
+reporter = ThreadSafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+	send_in_background = True, # So the thread that sends the report does not wait for Telegram.
+)
+
+def download(n):
+	sleep(random.random()/10) # Here you would download something, I will just sleep.
+	if random.random() < .01:
+		reporter.warn(f'Could not download item {n}.')
+	reporter.update(1)
+
+with reporter.report_loop(3333, 'Downloading with 32 threads', miminum_update_time_seconds=10):
+	with ThreadPoolExecutor(32) as executor:
+		list(executor.map(download, range(3333)))
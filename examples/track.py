@@ -0,0 +1,21 @@
+from progressreporting.TelegramProgressReporter import SafeTelegramReporter4Loops
+import my_telegram_bots # Here I keep the info from my bots, never make it public!
+from time import sleep
+
+reporter = SafeTelegramReporter4Loops(
+	bot_token = my_telegram_bots.robobot.token,
+	chat_id = my_telegram_bots.chat_ids['Robobot TCT setup'],
+)
+
+# If you just loop over something, there is no need to call `reporter.update`:
+for n in reporter.track(range(999), loop_name='A loop over a range', miminum_update_time_seconds=20):
+	sleep(33/999) # Here you would do some stuff, I will just sleep.
+
+# It also works when the number of iterations is not known in advance, e.g. with generators:
+def measurements():
+	for n in range(555):
+		sleep(33/555)
+		yield n
+
+for measurement in reporter.track(measurements(), loop_name='A generator of unknown length', miminum_update_time_seconds=20):
+	pass # Do something with each measurement.
@@ -0,0 +1,387 @@
+import asyncio
+import time
+import warnings
+from .TelegramProgressReporter import SafeTelegramReporter, SafeTelegramReporter4Loops, RequestsTransport, TelegramRateLimiter, TELEGRAM_API_URL, _NoBudgetError, _is_worth_retrying
+
+_BUDGET_POLLING_TIME_SECONDS = .1
+
+class AsyncRequestsTransport:
+	"""Runs a blocking transport, by default `RequestsTransport`, in worker
+	threads so it never blocks the event loop. This is the default transport
+	of `AsyncSafeTelegramReporter`.
+	
+	An async transport is any object with the coroutines `send_message(bot_token, **parameters)`
+	and `edit_message(bot_token, **parameters)`, see `RequestsTransport`.
+	"""
+	def __init__(self, transport=None, max_concurrent_requests:int=4):
+		"""
+		Arguments
+		---------
+		transport: optional
+			The blocking transport to run in threads. If not provided, a
+			new `RequestsTransport` is created.
+		max_concurrent_requests: int, default 4
+			Maximum number of requests that can be waiting for Telegram
+			at the same time, shared by all the reporters using this
+			transport.
+		"""
+		self._transport = transport if transport is not None else RequestsTransport()
+		self._max_concurrent_requests = max_concurrent_requests
+		self._semaphore = None
+	
+	def _get_semaphore(self):
+		if self._semaphore is None: # Create it lazily, so it belongs to the running event loop.
+			self._semaphore = asyncio.Semaphore(self._max_concurrent_requests)
+		return self._semaphore
+	
+	async def send_message(self, bot_token:str, **parameters):
+		async with self._get_semaphore():
+			return await asyncio.to_thread(self._transport.send_message, bot_token, **parameters)
+	
+	async def edit_message(self, bot_token:str, **parameters):
+		async with self._get_semaphore():
+			return await asyncio.to_thread(self._transport.edit_message, bot_token, **parameters)
+
+class HttpxTransport:
+	"""Talks to the Telegram API natively from the event loop using `httpx`,
+	which has to be installed separately (`pip install httpx`)."""
+	def __init__(self, max_concurrent_requests:int=4, timeout:float=1, api_url:str=TELEGRAM_API_URL):
+		"""
+		Arguments
+		---------
+		api_url: str, default `TELEGRAM_API_URL`
+			Where the Telegram API is, e.g. to use a `FakeTelegramServer`.
+		max_concurrent_requests: int, default 4
+			Maximum number of connections to Telegram at the same time.
+		timeout: float, default 1
+			Timeout for each request, in seconds.
+		"""
+		try:
+			import httpx
+		except ImportError as e:
+			raise ImportError('`HttpxTransport` needs `httpx`, install it with `pip install httpx` or use `AsyncRequestsTransport` instead.') from e
+		self._api_url = api_url
+		self._client = httpx.AsyncClient(
+			timeout = timeout,
+			limits = httpx.Limits(max_connections=max_concurrent_requests),
+		)
+	
+	async def _post(self, bot_token:str, method:str, parameters:dict):
+		response = await self._client.post(
+			f'{self._api_url}/bot{bot_token}/{method}',
+			data = {key: value for key,value in parameters.items() if value is not None}, # `requests` silently drops `None`s, `httpx` does not.
+		)
+		return response.json()
+	
+	async def send_message(self, bot_token:str, **parameters):
+		return await self._post(bot_token, 'sendMessage', parameters)
+	
+	async def edit_message(self, bot_token:str, **parameters):
+		return await self._post(bot_token, 'editMessageText', parameters)
+	
+	async def aclose(self):
+		"""Close the underlying connections."""
+		await self._client.aclose()
+
+class _AsyncBackgroundSender:
+	"""The same as `_BackgroundSender` but the jobs are coroutine functions
+	which are run one after the other by a task in the running event loop."""
+	def __init__(self, queue_size:int):
+		self._queue = asyncio.Queue(maxsize=queue_size)
+		self._latest_jobs = {} # Jobs that can be coalesced, by key. Only the latest one submitted for each key is kept.
+		self.dropped_jobs = 0 # Jobs lost because the queue was full.
+		self.coalesced_jobs = 0 # Jobs replaced by a newer one with the same key before being run.
+		self._task = asyncio.get_running_loop().create_task(self._work())
+	
+	def submit(self, job, coalesce_key=None):
+		"""Queue a job to be run in the background. Never blocks. See
+		`_BackgroundSender.submit`."""
+		if coalesce_key is not None:
+			if coalesce_key in self._latest_jobs: # It already has its place in the queue.
+				self._latest_jobs[coalesce_key] = job
+				self.coalesced_jobs += 1
+				return
+			self._latest_jobs[coalesce_key] = job
+			job = lambda: self._run_latest(coalesce_key)
+		try:
+			self._queue.put_nowait(job)
+		except asyncio.QueueFull:
+			self._latest_jobs.pop(coalesce_key, None)
+			self.dropped_jobs += 1
+	
+	async def _run_latest(self, coalesce_key):
+		await self._latest_jobs.pop(coalesce_key)()
+	
+	async def _work(self):
+		while True:
+			job = await self._queue.get()
+			if job is None: # This is the signal to stop.
+				return
+			try:
+				await job()
+			except Exception as e:
+				warnings.warn(f'A job in the background sender failed, reason: {repr(e)}')
+	
+	async def close(self, timeout:float):
+		"""Run all the jobs that are still waiting and stop the task. See
+		`_BackgroundSender.close`."""
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + timeout
+		try:
+			await asyncio.wait_for(self._queue.put(None), timeout)
+			await asyncio.wait_for(self._task, max(deadline-loop.time(), 0)) # This cancels the task if the time is over.
+		except asyncio.TimeoutError:
+			self._task.cancel()
+			return False
+		return True
+
+class AsyncSafeTelegramReporter(SafeTelegramReporter):
+	"""The same as `SafeTelegramReporter` but for asyncio, i.e. `send_message`
+	and `edit_message` return coroutines that never block the event loop."""
+	async def _acquire_budget(self, chat_id, priority:int, wait_seconds:float):
+		"""The same as `TelegramRateLimiter.acquire` but without blocking
+		the event loop while waiting."""
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + wait_seconds
+		while not self._rate_limiter.acquire(chat_id, priority, 0):
+			if loop.time() >= deadline:
+				return False
+			await asyncio.sleep(_BUDGET_POLLING_TIME_SECONDS)
+		return True
+	
+	async def _send_message(self, text:str, priority:int, wait_seconds:float, **parameters):
+		"""See `SafeTelegramReporter._send_message`."""
+		if self._disabled:
+			return
+		try:
+			return await self._call_transport('send_message', priority, wait_seconds, self._parameters(text=text, **parameters))
+		except _NoBudgetError as e:
+			if priority == TelegramRateLimiter.PRIORITY_FINAL:
+				warnings.warn(f'Could not send message to Telegram, reason: {e}.')
+		except Exception as e:
+			warnings.warn(f'Could not send message to Telegram, reason: {repr(e)}. ')
+	
+	async def _edit_message(self, text:str, message_id, priority:int, wait_seconds:float, **parameters):
+		"""See `SafeTelegramReporter._edit_message`."""
+		if self._disabled:
+			return
+		if self._last_edited_texts.get(message_id) == text: # Telegram rejects edits that do not change the message, so don't even try.
+			return
+		try:
+			response = await self._call_transport('edit_message', priority, wait_seconds, self._parameters(text=text, message_id=message_id, **parameters))
+			if isinstance(response, dict) and response.get('ok'): # Otherwise it was not delivered, so the same text must be tried again.
+				self._last_edited_texts[message_id] = text
+			return response
+		except _NoBudgetError as e:
+			if priority == TelegramRateLimiter.PRIORITY_FINAL:
+				warnings.warn(f'Could not edit message in Telegram, reason: {e}.')
+		except Exception as e:
+			warnings.warn(f'Could not edit message in Telegram, reason: {repr(e)}.')
+	
+	async def _call_transport(self, method:str, priority:int, wait_seconds:float, parameters:dict):
+		"""See `SafeTelegramReporter._call_transport`."""
+		if not await self._acquire_budget(parameters['chat_id'], priority, wait_seconds):
+			raise _NoBudgetError(f'no budget left in the rate limiter after waiting {wait_seconds} seconds')
+		try:
+			response = await getattr(self._transport, method)(bot_token=self._bot_token, **parameters)
+		except Exception:
+			self._send_failures += 1
+			raise
+		if not isinstance(response, dict) or not response.get('ok', False):
+			self._send_failures += 1
+		self._rate_limiter.handle_response(parameters['chat_id'], response)
+		return response
+	
+	@staticmethod
+	def _create_default_transport():
+		return AsyncRequestsTransport()
+
+class AsyncSafeTelegramReporter4Loops(AsyncSafeTelegramReporter, SafeTelegramReporter4Loops):
+	"""The same as `SafeTelegramReporter4Loops` but for asyncio. Example:
+	async with reporter.report_loop(99, 'My loop'):
+		for k in range(99):
+			await do_something()
+			await reporter.update(1)
+	
+	All the communication with Telegram happens in a background task,
+	so `update` and `warn` never wait for the network. The argument
+	`send_in_background` is therefore ignored.
+	"""
+	def __enter__(self):
+		raise TypeError(f'`{type(self).__name__}` has to be used with `async with`.')
+	
+	async def __aenter__(self):
+		self._start()
+		return self
+	
+	async def __aexit__(self, exc_type, exc_value, exc_traceback):
+		self._finish(exc_type, exc_value)
+		if self._sender is not None:
+			self._handle_closed_sender(await self._sender.close(timeout=self._time_to_close_sender()))
+		if len(self._sinks) > 0:
+			await asyncio.to_thread(self._close_sinks) # Don't block the event loop while they deliver their last events.
+	
+	def _create_sender(self):
+		if self._parent is not None or self._disabled: # Subloops in the message of the parent never send anything, and disabled reporters start no background work.
+			return None
+		return _AsyncBackgroundSender(queue_size=self._background_queue_size)
+	
+	def _deliver(self, function, *args, coalesce_key=None):
+		if self._disabled: # There is no sender, and nothing is sent, but the checkpoint is written right away as `SafeTelegramReporter4Loops` does.
+			if function == self._write_checkpoint:
+				SafeTelegramReporter4Loops._write_checkpoint(self, *args)
+			return
+		super()._deliver(function, *args, coalesce_key=coalesce_key)
+	
+	def _start_polling(self):
+		async def poll(): # A task instead of a thread, because the sender lives in the event loop.
+			while True:
+				await asyncio.sleep(self._poll_time_seconds)
+				self._poll_shared_counter()
+		self._polling_task = asyncio.get_running_loop().create_task(poll())
+	
+	def _stop_polling(self):
+		self._polling_task.cancel()
+	
+	async def update(self, count:int=1):
+		"""See `SafeTelegramReporter4Loops.update`."""
+		self._count += count
+		self._calls_until_check -= 1
+		if self._calls_until_check <= 0:
+			self._check()
+	
+	async def warn(self, message:str):
+		"""See `SafeTelegramReporter4Loops.warn`."""
+		self._warn(message)
+	
+	def track(self, iterable, total_loop_iterations:int=None, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60, check_every:int=None, rate_estimator=None, checkpoint=None, message_template:str=None):
+		"""The same as `SafeTelegramReporter4Loops.track` but returns an
+		asynchronous iterator, to be used with `async for`. `iterable` can
+		be either a normal or an asynchronous iterable. If you `break`
+		the loop, wrap it in `contextlib.aclosing` so the final status
+		is sent right away and not when the iterator is garbage collected."""
+		return super().track(
+			iterable = iterable,
+			total_loop_iterations = total_loop_iterations,
+			loop_name = loop_name,
+			miminum_update_time_seconds = miminum_update_time_seconds,
+			minimum_warn_time_seconds = minimum_warn_time_seconds,
+			check_every = check_every,
+			rate_estimator = rate_estimator,
+			checkpoint = checkpoint,
+			message_template = message_template,
+		)
+	
+	async def _track(self, iterable):
+		if not hasattr(iterable, '__aiter__'):
+			iterable = _iterate_asynchronously(iterable)
+		async with self:
+			pending = 0 # Items counted but not yet added to `self._count`.
+			try:
+				async for item in iterable:
+					yield item
+					pending += 1 # If we are here, the previous item was completely processed.
+					if pending >= self._calls_until_check: # See `SafeTelegramReporter4Loops._track`.
+						self._count += pending
+						pending = 0
+						self._check()
+			finally:
+				self._count += pending
+	
+	async def _deliver_starting_message(self, text:str):
+		try:
+			response = await self._send_message(text, TelegramRateLimiter.PRIORITY_FINAL, self._flush_timeout_seconds)
+			self._message_id_reporting_loop_progress = response['result']['message_id']
+		except Exception as e:
+			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+		else:
+			await self._replay_outbox(deadline=time.monotonic()+self._flush_timeout_seconds)
+		finally:
+			self._starting_message_sent.set()
+	
+	async def _deliver_progress(self, text:str):
+		try:
+			if self._message_id_reporting_loop_progress is not None:
+				response = await self._edit_message(text, self._message_id_reporting_loop_progress, TelegramRateLimiter.PRIORITY_PROGRESS, 0)
+			else: # If there was a problem while sending the starting message, let's send it now so later on we can edit it.
+				response = await self._send_message(text, TelegramRateLimiter.PRIORITY_PROGRESS, 0)
+				if response is not None:
+					self._message_id_reporting_loop_progress = response['result']['message_id']
+		except Exception as e:
+			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+		else:
+			if response is not None: # The connection works, so deliver whatever was left from before.
+				await self._replay_outbox(deadline=time.monotonic()+self._flush_timeout_seconds)
+	
+	async def _deliver_final_message(self, text:str):
+		try:
+			if self._message_id_reporting_loop_progress is None: # The progress message was never sent, so there is nothing to edit.
+				response = await self._deliver_reliably('send_message', self._parameters(text=text), self._final_deadline)
+				if response is None: # It went to the outbox, if any.
+					return
+				self._message_id_reporting_loop_progress = response['result']['message_id']
+			else:
+				await self._deliver_reliably('edit_message', self._parameters(text=text, message_id=self._message_id_reporting_loop_progress), self._final_deadline)
+			await self._deliver_reliably('send_message', self._parameters(text='Finished!', reply_to_message_id=self._message_id_reporting_loop_progress), self._final_deadline)
+		except Exception as e:
+			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+	
+	async def _deliver_reliably(self, method:str, parameters:dict, deadline:float):
+		"""See `SafeTelegramReporter4Loops._deliver_reliably`."""
+		if not await self._replay_outbox(deadline): # This message has to wait for the older ones.
+			self._outbox.append(self._bot_token, method, parameters)
+			return
+		reason = 'no time left'
+		for delay in self._retry_policy.delays():
+			if time.monotonic() + delay >= deadline:
+				break
+			await asyncio.sleep(delay)
+			try:
+				response = await self._call_transport(method, TelegramRateLimiter.PRIORITY_FINAL, max(0, deadline-time.monotonic()), parameters)
+			except Exception as e:
+				reason = repr(e)
+				continue
+			if not _is_worth_retrying(response):
+				return response
+			reason = repr(response)
+		self._give_up_delivering(method, parameters, reason)
+	
+	async def _replay_outbox(self, deadline:float):
+		"""See `SafeTelegramReporter4Loops._replay_outbox`."""
+		if self._outbox is None:
+			return True
+		pending = self._outbox.pending(self._bot_token)
+		if len(pending) == 0:
+			return True
+		if not self._outbox.replaying.acquire(blocking=False): # Someone else is delivering them.
+			return False
+		try:
+			n_delivered = 0
+			for method, parameters in pending:
+				try:
+					response = await self._call_transport(method, TelegramRateLimiter.PRIORITY_FINAL, max(0, deadline-time.monotonic()), parameters)
+				except Exception:
+					break
+				if _is_worth_retrying(response):
+					break
+				n_delivered += 1
+			self._outbox.remove(self._bot_token, n_delivered)
+			return n_delivered == len(pending)
+		finally:
+			self._outbox.replaying.release()
+	
+	async def _write_checkpoint(self, state:dict):
+		"""See `SafeTelegramReporter4Loops._write_checkpoint`."""
+		await asyncio.to_thread(SafeTelegramReporter4Loops._write_checkpoint, self, state) # Don't block the event loop with the disk.
+	
+	async def _deliver_warnings(self, text:str, wait_seconds:float):
+		return await self._send_message(
+			text,
+			TelegramRateLimiter.PRIORITY_WARNING,
+			wait_seconds,
+			reply_to_message_id = self._message_id_reporting_loop_progress,
+		)
+
+async def _iterate_asynchronously(iterable):
+	for item in iterable:
+		yield item
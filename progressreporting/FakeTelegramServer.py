@@ -0,0 +1,151 @@
+import http.server
+import threading
+import urllib.parse
+import random
+import time
+import json
+
+class FakeTelegramServer:
+	"""A local stand in for the Telegram API implementing `sendMessage` and
+	`editMessageText`, so the reporters can be tried and benchmarked without
+	a real bot nor network access. Usage:
+	
+	```
+	with FakeTelegramServer(latency_seconds=.5, error_rate=.1) as server:
+		reporter = SafeTelegramReporter4Loops(
+			bot_token = 'fake',
+			chat_id = 1,
+			transport = RequestsTransport(api_url=server.api_url),
+		)
+		...
+	print(server.requests_count)
+	```
+	"""
+	def __init__(self, latency_seconds:float=0, error_rate:float=0, too_many_requests_rate:float=0, retry_after_seconds:int=1, port:int=0):
+		"""
+		Arguments
+		---------
+		latency_seconds: float, default 0
+			Time that each request takes to be answered.
+		error_rate: float, default 0
+			Probability of answering a request with an internal server error.
+		too_many_requests_rate: float, default 0
+			Probability of answering a request with a 429 "Too Many Requests"
+			like Telegram does when the bot is flooding.
+		retry_after_seconds: int, default 1
+			The `retry_after` reported in the 429 responses.
+		port: int, default 0
+			Port to listen in `localhost`, 0 means any free port.
+		"""
+		self.latency_seconds = latency_seconds
+		self.error_rate = error_rate
+		self.too_many_requests_rate = too_many_requests_rate
+		self.retry_after_seconds = retry_after_seconds
+		self.messages = {} # {message_id: text}
+		self.requests_count = {} # {method: number of requests received}
+		self.responses_count = {} # {status code: number of responses sent}
+		self._lock = threading.Lock()
+		self._next_message_id = 1
+		self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), _make_request_handler(self))
+		self._httpd.daemon_threads = True
+		self._thread = None
+	
+	@property
+	def api_url(self):
+		"""The URL to give to the transports in place of `TELEGRAM_API_URL`."""
+		host, port = self._httpd.server_address[:2]
+		return f'http://{host}:{port}'
+	
+	def start(self):
+		"""Start serving in a background thread."""
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._httpd.serve_forever, name='FakeTelegramServer', daemon=True)
+			self._thread.start()
+		return self
+	
+	def stop(self):
+		"""Stop serving and release the port."""
+		if self._thread is not None:
+			self._httpd.shutdown()
+			self._thread.join()
+			self._thread = None
+		self._httpd.server_close()
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.stop()
+	
+	@property
+	def total_requests(self):
+		with self._lock:
+			return sum(self.requests_count.values())
+	
+	def reset_counters(self):
+		"""Forget the requests and responses counted so far."""
+		with self._lock:
+			self.requests_count = {}
+			self.responses_count = {}
+	
+	def _answer(self, method:str, parameters:dict):
+		"""Returns `(status, body)` for a request to `method`."""
+		with self._lock:
+			self.requests_count[method] = self.requests_count.get(method, 0) + 1
+		if self.latency_seconds > 0:
+			time.sleep(self.latency_seconds)
+		dice = random.random()
+		if dice < self.too_many_requests_rate:
+			return 429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after_seconds}', 'parameters': {'retry_after': self.retry_after_seconds}}
+		if dice < self.too_many_requests_rate + self.error_rate:
+			return 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+		if 'chat_id' not in parameters or 'text' not in parameters:
+			return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: chat_id and text are required'}
+		with self._lock:
+			if method == 'sendMessage':
+				message_id = self._next_message_id
+				self._next_message_id += 1
+			elif method == 'editMessageText':
+				try:
+					message_id = int(parameters.get('message_id'))
+				except (TypeError, ValueError):
+					message_id = None
+				if message_id not in self.messages:
+					return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message to edit not found'}
+				if self.messages[message_id] == parameters['text']:
+					return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message is not modified'}
+			else:
+				return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+			self.messages[message_id] = parameters['text']
+		return 200, {'ok': True, 'result': {'message_id': message_id, 'chat': {'id': parameters['chat_id']}, 'date': int(time.time()), 'text': parameters['text']}}
+	
+	def _count_response(self, status:int):
+		with self._lock:
+			self.responses_count[status] = self.responses_count.get(status, 0) + 1
+
+def _make_request_handler(server:FakeTelegramServer):
+	class _RequestHandler(http.server.BaseHTTPRequestHandler):
+		protocol_version = 'HTTP/1.1' # Keep alive, as `requests.Session` does with Telegram.
+		
+		def _handle(self):
+			# The path looks like `/bot<token>/<method>`, the parameters can come either in the query or in the body.
+			method = self.path.split('?')[0].rsplit('/', 1)[-1]
+			parameters = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+			length = int(self.headers.get('Content-Length') or 0)
+			if length > 0:
+				parameters.update(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+			status, body = server._answer(method, parameters)
+			server._count_response(status)
+			body = json.dumps(body).encode()
+			self.send_response(status)
+			self.send_header('Content-Type', 'application/json')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		
+		do_GET = _handle
+		do_POST = _handle
+		
+		def log_message(self, format, *args):
+			pass # Do not flood stderr with one line per request.
+	return _RequestHandler
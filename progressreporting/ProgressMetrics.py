@@ -0,0 +1,176 @@
+import threading
+import datetime
+import json
+import warnings
+from .TelegramProgressReporter import get_active_loop_reporters
+
+_PROMETHEUS_METRICS = [ # (key in `SafeTelegramReporter4Loops.metrics`, name, type, help)
+	('count', 'progressreporting_iterations', 'gauge', 'Iterations of the loop completed so far.'),
+	('total', 'progressreporting_iterations_expected', 'gauge', 'Total number of iterations of the loop, if known.'),
+	('rate', 'progressreporting_rate_iterations_per_second', 'gauge', 'Current rate of the loop.'),
+	('average_rate', 'progressreporting_average_rate_iterations_per_second', 'gauge', 'Average rate of the loop since it started.'),
+	('elapsed_seconds', 'progressreporting_elapsed_seconds', 'gauge', 'Time since the loop started.'),
+	('expected_finish_timestamp', 'progressreporting_expected_finish_timestamp_seconds', 'gauge', 'When the loop is expected to finish, as a Unix timestamp.'),
+	('warnings', 'progressreporting_warnings_total', 'counter', 'Warnings reported by the loop.'),
+	('send_failures', 'progressreporting_send_failures_total', 'counter', 'Requests to Telegram that failed.'),
+]
+
+def collect_metrics():
+	"""Returns a list with `metrics()` of each loop being reported right
+	now in this process, see `SafeTelegramReporter4Loops.metrics`."""
+	return [reporter.metrics() for reporter in get_active_loop_reporters()]
+
+def _escape_label(value:str):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(metrics:list=None):
+	"""Returns `metrics` in the Prometheus text exposition format, see
+	https://prometheus.io/docs/instrumenting/exposition_formats/
+	
+	Arguments
+	---------
+	metrics: list of dict, optional
+		As returned by `collect_metrics`, which is called if not given.
+	"""
+	if metrics is None:
+		metrics = collect_metrics()
+	lines = []
+	for key, name, metric_type, help_text in _PROMETHEUS_METRICS:
+		lines.append(f'# HELP {name} {help_text}')
+		lines.append(f'# TYPE {name} {metric_type}')
+		for loop_metrics in metrics:
+			if loop_metrics[key] is None: # E.g. the total of a loop of unknown length.
+				continue
+			lines.append(f'{name}{{loop="{_escape_label(loop_metrics["loop"])}",loop_id="{loop_metrics["loop_id"]}"}} {loop_metrics[key]}')
+	return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+	"""Serves the metrics of the loops being reported in this process at
+	`http://<host>:<port>/metrics` in the Prometheus text format, from a
+	background thread. Usage:
+	
+	```
+	with MetricsServer(port=9464):
+		with reporter.report_loop(...):
+			...
+	```
+	"""
+	def __init__(self, port:int=9464, host:str='127.0.0.1'):
+		"""
+		Arguments
+		---------
+		port: int, default 9464
+			Port where to listen, 0 means any free port.
+		host: str, default `'127.0.0.1'`
+			Interface where to listen. Use `'0.0.0.0'` to be scraped
+			from other machines.
+		"""
+		import http.server # Here, so it is only imported if it is needed.
+		self._httpd = http.server.ThreadingHTTPServer((host, port), _make_request_handler(http.server))
+		self._httpd.daemon_threads = True
+		self._thread = None
+	
+	@property
+	def url(self):
+		host, port = self._httpd.server_address[:2]
+		return f'http://{host}:{port}/metrics'
+	
+	def start(self):
+		"""Start serving in a background thread."""
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._httpd.serve_forever, name='MetricsServer', daemon=True)
+			self._thread.start()
+		return self
+	
+	def stop(self):
+		"""Stop serving and release the port."""
+		if self._thread is not None:
+			self._httpd.shutdown()
+			self._thread.join()
+			self._thread = None
+		self._httpd.server_close()
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.stop()
+
+def _make_request_handler(server_module):
+	class _MetricsRequestHandler(server_module.BaseHTTPRequestHandler):
+		def do_GET(self):
+			if self.path.split('?')[0] != '/metrics':
+				self.send_error(404)
+				return
+			body = render_prometheus().encode()
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		
+		def log_message(self, format, *args):
+			pass # Do not flood stderr with one line per scrape.
+	return _MetricsRequestHandler
+
+class MetricsSnapshots:
+	"""Appends the metrics of the loops being reported in this process to
+	a file in JSON Lines format, one line per loop, every `interval_seconds`
+	from a background thread. Usage:
+	
+	```
+	with MetricsSnapshots('metrics.jsonl', interval_seconds=60):
+		with reporter.report_loop(...):
+			...
+	```
+	"""
+	def __init__(self, path, interval_seconds:float=60):
+		"""
+		Arguments
+		---------
+		path: str or Path
+			The file where to write. It is created if it does not exist.
+		interval_seconds: float, default 60
+			Time between snapshots.
+		"""
+		self._path = path
+		self._interval_seconds = interval_seconds
+		self._stop_event = threading.Event()
+		self._thread = None
+	
+	def write_snapshot(self):
+		"""Write a snapshot right now."""
+		now = datetime.datetime.now().isoformat(timespec='seconds')
+		metrics = collect_metrics()
+		if len(metrics) == 0:
+			return
+		with open(self._path, 'a') as ofile:
+			ofile.write(''.join(json.dumps({'time': now, **loop_metrics}, ensure_ascii=False) + '\n' for loop_metrics in metrics))
+	
+	def start(self):
+		"""Start taking snapshots in a background thread."""
+		if self._thread is None:
+			self._stop_event.clear()
+			self._thread = threading.Thread(target=self._work, name='MetricsSnapshots', daemon=True)
+			self._thread.start()
+		return self
+	
+	def _work(self):
+		while not self._stop_event.wait(self._interval_seconds):
+			try:
+				self.write_snapshot()
+			except Exception as e:
+				warnings.warn(f'Could not write the metrics snapshot, reason: {repr(e)}')
+	
+	def stop(self):
+		"""Stop taking snapshots."""
+		if self._thread is not None:
+			self._stop_event.set()
+			self._thread.join()
+			self._thread = None
+	
+	def __enter__(self):
+		return self.start()
+	
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.stop()
@@ -0,0 +1,225 @@
+import sys
+import json
+import threading
+import warnings
+from .TelegramProgressReporter import SafeTelegramReporter, TelegramRateLimiter, _BackgroundSender, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS
+
+class Sink:
+	"""Somewhere, in addition to the Telegram chat of the reporter, where
+	the progress of the loops is delivered. Give them to the reporter with
+	`SafeTelegramReporter4Loops(..., sinks=[FileSink('loops.jsonl'), ...])`.
+	
+	The reporter hands events to the sink, which are dictionaries like
+	`{'event': 'progress', 'loop': 'My loop', 'loop_id': 3, 'time': '2021-06-28T12:34:56', 'count': 33, 'total': 99, ...}`
+	where `event` is one of `'loop_started'`, `'progress'`, `'warning'`
+	and `'loop_finished'`. The events are collected and delivered in
+	batches by a dedicated thread of each sink, so a slow sink never
+	holds back the loop nor the other sinks.
+	
+	To create a new kind of sink, inherit from this class and implement
+	`write`.
+	"""
+	def __init__(self, minimum_update_time_seconds:float=0, maximum_pending_events:int=1000):
+		"""
+		Arguments
+		---------
+		minimum_update_time_seconds: float, default 0
+			Minimum time between two `'progress'` events of the same loop.
+			With 0, the sink gets every progress check of the reporter.
+			The other events are never throttled.
+		maximum_pending_events: int, default 1000
+			Maximum number of events waiting to be delivered, if there
+			are more they are dropped.
+		"""
+		self.minimum_update_time_seconds = minimum_update_time_seconds
+		self._maximum_pending_events = maximum_pending_events
+		self._pending_events = []
+		self._lock = threading.Lock()
+		self._sender = None
+		self._n_loops = 0 # Loops currently using this sink, it can be shared e.g. by subloops.
+		self.dropped_events = 0
+	
+	def write(self, events:list):
+		"""Deliver a batch of events, in order. This is called from the
+		thread of the sink, never from the loop. Any error is converted
+		into a warning."""
+		raise NotImplementedError(f'`{type(self).__name__}` must implement `write`.')
+	
+	def render(self, event:dict):
+		"""Returns a short human readable description of `event`."""
+		if event['event'] == 'loop_started':
+			return f'🕰️ Starting "{event["loop"]}"'
+		if event['event'] == 'warning':
+			return f'⚠️ {event["loop"]}: {event["message"]}'
+		if event['total'] is None:
+			progress = f'{event["count"]} iterations'
+		else:
+			progress = f'{event["count"]}/{event["total"]} | {int(event["count"]/event["total"]*100)} %'
+		if event['event'] == 'loop_finished':
+			if event['completed']:
+				return f'✅ {event["loop"]} | {progress} | {event["elapsed_seconds"]:.0f} s'
+			return f'💥 {event["loop"]} | {progress} | {event["elapsed_seconds"]:.0f} s | {event["reason"]}'
+		message_string = f'{event["loop"]} | {progress} | {event["rate"]:.3g} it/s'
+		if event['expected_finish'] is not None:
+			message_string += f' | expected finish {event["expected_finish"]}'
+		return message_string
+	
+	def handle(self, event:dict):
+		"""Called by the reporter, never blocks."""
+		with self._lock:
+			if len(self._pending_events) >= self._maximum_pending_events:
+				self.dropped_events += 1
+				return
+			self._pending_events.append(event)
+			sender = self._sender
+		if sender is not None:
+			sender.submit(self._write_pending_events, coalesce_key='write') # All the events pending are written in one go.
+	
+	def _write_pending_events(self):
+		with self._lock:
+			events, self._pending_events = self._pending_events, []
+		if len(events) == 0:
+			return
+		try:
+			self.write(events)
+		except Exception as e:
+			warnings.warn(f'Could not deliver {len(events)} events to {type(self).__name__}, reason: {repr(e)}')
+	
+	def open(self):
+		"""Called by the reporter when a loop starts."""
+		with self._lock:
+			self._n_loops += 1
+			if self._sender is None:
+				self._sender = _BackgroundSender(queue_size=2) # There is never more than one job waiting, see `handle`.
+	
+	def close(self, timeout:float):
+		"""Called by the reporter when a loop ends. Delivers the events
+		that are still pending and, if no other loop is using this sink,
+		stops its thread.
+		
+		Returns
+		-------
+		finished: bool
+			`False` if the events could not be delivered within `timeout`.
+		"""
+		with self._lock:
+			self._n_loops -= 1
+			sender = self._sender
+			if self._n_loops > 0: # Someone else is still using it, just make sure everything is delivered soon.
+				sender.submit(self._write_pending_events, coalesce_key='write')
+				return True
+			self._sender = None
+		sender.submit(self._write_pending_events, coalesce_key='write')
+		finished = sender.close(timeout=timeout)
+		if self.dropped_events > 0:
+			warnings.warn(f'{self.dropped_events} events were not delivered to {type(self).__name__} because too many were pending.')
+			self.dropped_events = 0
+		return finished
+
+class StdoutSink(Sink):
+	"""Prints one line per event in the terminal."""
+	def __init__(self, minimum_update_time_seconds:float=10, stream=None, **kwargs):
+		"""
+		Arguments
+		---------
+		stream: file like, optional
+			Where to print, by default `sys.stdout`.
+		Other arguments:
+			See `Sink`.
+		"""
+		super().__init__(minimum_update_time_seconds=minimum_update_time_seconds, **kwargs)
+		self._stream = stream
+	
+	def write(self, events:list):
+		stream = self._stream if self._stream is not None else sys.stdout
+		stream.write(''.join(f'[{event["time"]}] {self.render(event)}\n' for event in events))
+		stream.flush()
+
+class FileSink(Sink):
+	"""Appends the events to a file in JSON Lines format, i.e. one JSON
+	object per line, by default at full resolution."""
+	def __init__(self, path, minimum_update_time_seconds:float=0, **kwargs):
+		"""
+		Arguments
+		---------
+		path: str or Path
+			The file where to write. It is created if it does not exist.
+		Other arguments:
+			See `Sink`.
+		"""
+		super().__init__(minimum_update_time_seconds=minimum_update_time_seconds, **kwargs)
+		self._path = path
+	
+	def write(self, events:list):
+		with open(self._path, 'a') as ofile:
+			ofile.write(''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events))
+
+class WebhookSink(Sink):
+	"""Posts the events to a webhook as `{"text": "..."}`, which is what
+	the incoming webhooks of e.g. Slack and Mattermost understand. All
+	the events of a batch go in a single post."""
+	def __init__(self, url:str, minimum_update_time_seconds:float=60, timeout:float=1, **kwargs):
+		"""
+		Arguments
+		---------
+		url: str
+			The URL of the webhook.
+		timeout: float, default 1
+			Timeout for each request, in seconds.
+		Other arguments:
+			See `Sink`.
+		"""
+		super().__init__(minimum_update_time_seconds=minimum_update_time_seconds, **kwargs)
+		self._url = url
+		self._timeout = timeout
+		import requests # Here, so `requests` is only imported if it is needed.
+		self._session = requests.Session()
+	
+	def write(self, events:list):
+		response = self._session.post(
+			self._url,
+			json = {'text': '\n'.join(self.render(event) for event in events)},
+			timeout = self._timeout,
+		)
+		response.raise_for_status()
+
+class TelegramSink(Sink):
+	"""Reports the loops in another Telegram chat, with one message per
+	loop which is edited with the progress, e.g. to send throttled
+	summaries to a group while the main chat gets all the details."""
+	def __init__(self, bot_token:str, chat_id:str, minimum_update_time_seconds:float=60, transport=None, rate_limiter:TelegramRateLimiter=None, **default_parameters):
+		"""
+		Arguments
+		---------
+		bot_token, chat_id, transport, rate_limiter, default_parameters:
+			See `SafeTelegramReporter`.
+		minimum_update_time_seconds: float, default 60
+			See `Sink`.
+		"""
+		super().__init__(minimum_update_time_seconds=minimum_update_time_seconds)
+		self._reporter = SafeTelegramReporter(
+			bot_token = bot_token,
+			chat_id = chat_id,
+			transport = transport,
+			rate_limiter = rate_limiter,
+			**default_parameters,
+		)
+		self._message_ids = {} # {loop_id: message_id}
+	
+	def write(self, events:list):
+		latest_progress = {event['loop_id']: event for event in events if event['event'] == 'progress'}
+		for event in events:
+			if event['event'] == 'progress' and latest_progress[event['loop_id']] is not event:
+				continue # Only the latest progress of each loop is worth sending.
+			message_id = self._message_ids.get(event['loop_id'])
+			if event['event'] == 'warning':
+				self._reporter._send_message(self.render(event), TelegramRateLimiter.PRIORITY_WARNING, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS, reply_to_message_id=message_id)
+			elif message_id is None:
+				response = self._reporter._send_message(self.render(event), TelegramRateLimiter.PRIORITY_FINAL, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS)
+				if response is not None and response.get('ok'):
+					self._message_ids[event['loop_id']] = response['result']['message_id']
+			else:
+				priority = TelegramRateLimiter.PRIORITY_PROGRESS if event['event'] == 'progress' else TelegramRateLimiter.PRIORITY_FINAL
+				self._reporter._edit_message(self.render(event), message_id, priority, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS)
+			if event['event'] == 'loop_finished':
+				self._message_ids.pop(event['loop_id'], None)
@@ -1,9 +1,46 @@
 import datetime
+import time
 import warnings
-import requests
-import humanize
+import threading
+import queue
+import random
+import json
+import os
+import re
+import collections
+import itertools
+import weakref
+import importlib
+import math
+import atexit
 
-def send_message(requests_session:requests.Session, bot_token:str, **parameters):
+class _LazyModule:
+	"""Stands for a module that is imported only the first time that one
+	of its attributes is used, so importing this module stays fast for
+	short lived programs that may never send anything."""
+	def __init__(self, name:str):
+		self._name = name
+	
+	def __getattr__(self, attribute:str):
+		return getattr(importlib.import_module(self._name), attribute)
+
+requests = _LazyModule('requests')
+humanize = _LazyModule('humanize')
+multiprocessing = _LazyModule('multiprocessing')
+pathlib = _LazyModule('pathlib')
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+DISABLED_ENVIRONMENT_VARIABLE = 'PROGRESSREPORTING_DISABLED'
+
+def is_disabled():
+	"""Returns `True` if the environment variable `PROGRESSREPORTING_DISABLED`
+	is set to anything but `0`, `false` or `no`. In this case the reporters
+	don't send anything nor start any thread, so they cost almost nothing,
+	e.g. to switch them off in tests or in thousands of short jobs without
+	changing the code."""
+	return os.environ.get(DISABLED_ENVIRONMENT_VARIABLE, '').strip().lower() not in {'', '0', 'false', 'no'}
+
+def send_message(requests_session:'requests.Session', bot_token:str, api_url:str=TELEGRAM_API_URL, **parameters):
 	"""Send a message.
 	
 	Arguments
@@ -12,18 +49,20 @@ def send_message(requests_session:requests.Session, bot_token:str, **parameters)
 		An instance handling the session.
 	bot_token: str
 		The token of the bot to use, e.g. `'123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11'`.
+	api_url: str, default `TELEGRAM_API_URL`
+		Where the Telegram API is, e.g. to use a `FakeTelegramServer`.
 	**parameters:
 		Any of the parameters specified in the API, see here https://core.telegram.org/bots/api#sendmessage.
 		The most relevant are the `chat_id` and `text`.
 	"""
 	response = requests_session.get(
-		f'https://api.telegram.org/bot{bot_token}/sendMessage',
+		f'{api_url}/bot{bot_token}/sendMessage',
 		data = parameters,
 		timeout = 1, # https://stackoverflow.com/a/21966169/8849755
 	)
 	return response.json()
 
-def edit_message(requests_session:requests.Session, bot_token:str, **parameters):
+def edit_message(requests_session:'requests.Session', bot_token:str, api_url:str=TELEGRAM_API_URL, **parameters):
 	"""Edit a message that was previously sent.
 	
 	Arguments
@@ -32,20 +71,467 @@ def edit_message(requests_session:requests.Session, bot_token:str, **parameters)
 		An instance handling the session.
 	bot_token: str
 		The token of the bot to use, e.g. `'123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11'`.
+	api_url: str, default `TELEGRAM_API_URL`
+		Where the Telegram API is, e.g. to use a `FakeTelegramServer`.
 	**parameters:
 		Any of the parameters specified in the API, see here hthttps://core.telegram.org/bots/api#editmessagetexttps://core.telegram.org/bots/api#editmessagetext.
 		The most relevant are the `chat_id` and `text`.
 	"""
-	requests_session.post(
-		f'https://api.telegram.org/bot{bot_token}/editMessageText',
+	response = requests_session.post(
+		f'{api_url}/bot{bot_token}/editMessageText',
 		data = parameters,
 		timeout = 1, # https://stackoverflow.com/a/21966169/8849755
 	)
+	return response.json()
+
+class _TokenBucket:
+	def __init__(self, rate:float, capacity:float):
+		self.rate = rate # Tokens per second.
+		self.capacity = capacity
+		self._tokens = capacity
+		self._last_refill = time.monotonic()
+	
+	def time_until_available(self, now:float):
+		"""Seconds until there is one token available."""
+		self._tokens = min(self.capacity, self._tokens + max(0, now-self._last_refill)*self.rate)
+		self._last_refill = max(now, self._last_refill)
+		return max(0, (1-self._tokens)/self.rate)
+	
+	def take(self):
+		self._tokens -= 1
+
+class TelegramRateLimiter:
+	"""Hands out the budget of messages that a bot can send without being
+	throttled by Telegram, see https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this.
+	There is one bucket for each chat and one for the whole bot, and when 
+	there is not enough budget for everyone it goes first to the most
+	important messages, i.e. those with the lowest `priority`. If Telegram
+	answers with a "429 Too Many Requests" the chat is silenced for the
+	time Telegram asks.
+	
+	All the reporters using the same bot share the same instance, see
+	`get_rate_limiter`.
+	"""
+	PRIORITY_FINAL = 0 # Starting and final status of loops, and messages sent explicitly by the user.
+	PRIORITY_WARNING = 1
+	PRIORITY_PROGRESS = 2
+	
+	def __init__(self, messages_per_minute_per_chat:float=60, burst_per_chat:int=5, messages_per_second_per_bot:float=30):
+		"""
+		Arguments
+		---------
+		messages_per_minute_per_chat: float, default 60
+			Sustained number of messages per minute to each chat. Telegram
+			allows about one per second in a private chat, but only 20 per
+			minute in groups, so use 20 when reporting to a group.
+		burst_per_chat: int, default 5
+			Number of messages that can be sent to a chat in a row after
+			some time without sending anything.
+		messages_per_second_per_bot: float, default 30
+			Number of messages per second to all the chats together.
+		"""
+		self._messages_per_minute_per_chat = messages_per_minute_per_chat
+		self._burst_per_chat = burst_per_chat
+		self._bot_bucket = _TokenBucket(rate=messages_per_second_per_bot, capacity=messages_per_second_per_bot)
+		self._chat_buckets = {}
+		self._silenced_until = {} # By chat ID, when Telegram told us to retry after some time.
+		self._waiting = {} # By chat ID, number of threads waiting for budget by priority.
+		self._condition = threading.Condition()
+	
+	def _time_until_available(self, chat_id, now:float):
+		if chat_id not in self._chat_buckets:
+			self._chat_buckets[chat_id] = _TokenBucket(rate=self._messages_per_minute_per_chat/60, capacity=self._burst_per_chat)
+		return max(
+			self._silenced_until.get(chat_id, 0) - now,
+			self._chat_buckets[chat_id].time_until_available(now),
+			self._bot_bucket.time_until_available(now),
+		)
+	
+	def acquire(self, chat_id, priority:int, timeout:float):
+		"""Take the budget for sending one message to `chat_id`.
+		
+		Arguments
+		---------
+		chat_id:
+			The chat to which the message is going to be sent.
+		priority: int
+			One of `PRIORITY_FINAL`, `PRIORITY_WARNING` or `PRIORITY_PROGRESS`.
+			While someone with a more important priority is waiting for
+			the same chat, nobody with a less important one gets budget
+			for it.
+		timeout: float
+			Maximum time to wait for the budget, in seconds. Use 0 to 
+			never wait.
+		
+		Returns
+		-------
+		acquired: bool
+			`True` if the message can be sent, `False` otherwise.
+		"""
+		deadline = time.monotonic() + timeout
+		with self._condition:
+			waiting = self._waiting.setdefault(chat_id, [0,0,0])
+			waiting[priority] += 1
+			try:
+				while True:
+					now = time.monotonic()
+					if sum(waiting[:priority]) == 0: # Nobody more important is waiting for this chat.
+						wait = self._time_until_available(chat_id, now)
+						if wait <= 0:
+							self._chat_buckets[chat_id].take()
+							self._bot_bucket.take()
+							return True
+					else:
+						wait = deadline - now # Until someone notifies us.
+					if now >= deadline:
+						return False
+					self._condition.wait(min(wait, deadline-now))
+			finally:
+				waiting[priority] -= 1
+				if sum(waiting) == 0:
+					del self._waiting[chat_id]
+				self._condition.notify_all()
+	
+	def handle_response(self, chat_id, response):
+		"""Look at the response from Telegram and, if it asks us to slow
+		down, silence the chat for the time it asks."""
+		if isinstance(response, dict) and response.get('error_code') == 429:
+			retry_after = response.get('parameters', {}).get('retry_after', 1)
+			with self._condition:
+				self._silenced_until[chat_id] = max(self._silenced_until.get(chat_id, 0), time.monotonic() + retry_after)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(bot_token:str):
+	"""Returns the `TelegramRateLimiter` shared by everyone in this process
+	that uses the bot with `bot_token`."""
+	with _rate_limiters_lock:
+		if bot_token not in _rate_limiters:
+			_rate_limiters[bot_token] = TelegramRateLimiter()
+		return _rate_limiters[bot_token]
+
+class RetryPolicy:
+	"""How many times, and how often, to retry sending the final status
+	of a loop. The time between attempts grows exponentially, with some
+	randomness so that many reporters that failed at the same time do 
+	not retry all at the same time."""
+	def __init__(self, max_attempts:int=5, initial_delay_seconds:float=1, maximum_delay_seconds:float=60, jitter:float=.5):
+		"""
+		Arguments
+		---------
+		max_attempts: int, default 5
+			Maximum number of attempts, including the first one.
+		initial_delay_seconds: float, default 1
+			Time to wait before the second attempt. It doubles after each
+			attempt.
+		maximum_delay_seconds: float, default 60
+			Maximum time to wait between two attempts.
+		jitter: float, default 0.5
+			Each time to wait is multiplied by a random number between
+			`1-jitter` and 1.
+		"""
+		if not 0 <= jitter <= 1:
+			raise ValueError(f'`jitter` must be between 0 and 1, received {jitter}.')
+		self.max_attempts = max_attempts
+		self.initial_delay_seconds = initial_delay_seconds
+		self.maximum_delay_seconds = maximum_delay_seconds
+		self.jitter = jitter
+	
+	def delays(self):
+		"""Yields the time to wait before each attempt, the first one being 0."""
+		for n_attempt in range(self.max_attempts):
+			if n_attempt == 0:
+				yield 0
+			else:
+				yield min(self.maximum_delay_seconds, self.initial_delay_seconds*2**(n_attempt-1))*random.uniform(1-self.jitter, 1)
+
+def _is_worth_retrying(response):
+	"""`True` if Telegram answered but asked to try again later."""
+	return isinstance(response, dict) and response.get('ok') == False and (response.get('error_code') == 429 or response.get('error_code', 0) >= 500)
+
+class Outbox:
+	"""Keeps the messages that could not be delivered to Telegram in an
+	append only file, one JSON per line, so they can be delivered later
+	in the same order, even by another process. Only the ID of the bot
+	is written into the file, never its token.
+	"""
+	def __init__(self, path):
+		"""
+		Arguments
+		---------
+		path: str or Path
+			The file where to keep the messages. It is created when needed.
+		"""
+		self._path = pathlib.Path(path)
+		self._lock = threading.Lock()
+		self.replaying = threading.Lock() # To prevent two reporters from delivering the same messages at the same time.
+		self._maybe_pending = self._path.exists() # So we don't have to look at the file each time.
+	
+	@staticmethod
+	def _bot_id(bot_token:str):
+		return bot_token.split(':')[0] # The part before ":" is the ID of the bot, the rest is the secret.
+	
+	def _read(self):
+		if not self._path.exists():
+			return []
+		with open(self._path) as ifile:
+			return [json.loads(line) for line in ifile if line.strip() != '']
+	
+	def append(self, bot_token:str, method:str, parameters:dict):
+		"""Add a message at the end.
+		
+		Arguments
+		---------
+		bot_token: str
+			The token of the bot that has to deliver the message.
+		method: str
+			The method of the transport to call, i.e. `'send_message'`
+			or `'edit_message'`.
+		parameters: dict
+			The parameters for the Telegram API.
+		"""
+		with self._lock:
+			with open(self._path, 'a') as ofile:
+				print(json.dumps({'bot_id': self._bot_id(bot_token), 'method': method, 'parameters': parameters}), file=ofile)
+				ofile.flush()
+				os.fsync(ofile.fileno())
+			self._maybe_pending = True
+	
+	def pending(self, bot_token:str):
+		"""Returns a list with the messages waiting to be delivered by
+		the bot, in order. Each element is a tuple `(method, parameters)`."""
+		if not self._maybe_pending:
+			return []
+		with self._lock:
+			bot_id = self._bot_id(bot_token)
+			pending = [(entry['method'],entry['parameters']) for entry in self._read() if entry['bot_id'] == bot_id]
+			if len(pending) == 0 and not self._path.exists():
+				self._maybe_pending = False
+			return pending
+	
+	def remove(self, bot_token:str, n:int):
+		"""Remove the first `n` messages of the bot, once they were delivered."""
+		with self._lock:
+			bot_id = self._bot_id(bot_token)
+			remaining = []
+			for entry in self._read():
+				if entry['bot_id'] == bot_id and n > 0:
+					n -= 1
+				else:
+					remaining.append(entry)
+			if len(remaining) == 0:
+				self._path.unlink(missing_ok=True)
+				self._maybe_pending = False
+				return
+			temporary_path = self._path.with_name(self._path.name + '.tmp')
+			with open(temporary_path, 'w') as ofile:
+				for entry in remaining:
+					print(json.dumps(entry), file=ofile)
+				ofile.flush()
+				os.fsync(ofile.fileno())
+			os.replace(temporary_path, self._path) # Atomic, so if we crash the file is never half written.
+
+class LoopCheckpoint:
+	"""Keeps the state of a loop in a small JSON file so that, if the
+	program is restarted, the loop is reported from where it was: with
+	the same count, in the same Telegram message and with an expected
+	finish time that takes into account the rate before the restart.
+	Usage:
+	
+	```
+	checkpoint = LoopCheckpoint('my_scan.checkpoint')
+	with reporter.report_loop(999, 'My scan', checkpoint=checkpoint):
+		for k in range(reporter.completed_iterations, 999): # Skip what was already done.
+			do_something(k)
+			reporter.update(1)
+	```
+	
+	The loop is recognized by its name and its total number of iterations,
+	so it has to be given a name. The file is deleted when the loop is 
+	completed.
+	"""
+	def __init__(self, path, minimum_save_time_seconds:float=60):
+		"""
+		Arguments
+		---------
+		path: str or Path
+			The file where to keep the state. It is created when needed.
+		minimum_save_time_seconds: float, default 60
+			Minimum time between two consecutive writes of the file 
+			while the loop runs.
+		"""
+		self._path = pathlib.Path(path)
+		self.minimum_save_time_seconds = minimum_save_time_seconds
+	
+	def load(self):
+		"""Returns the state last saved, or `None` if there is none."""
+		if not self._path.exists():
+			return None
+		try:
+			with open(self._path) as ifile:
+				return json.load(ifile)
+		except (OSError, ValueError) as e:
+			warnings.warn(f'Could not read the checkpoint in {self._path}, the loop will start from the beginning. Reason: {repr(e)}')
+	
+	def save(self, state:dict):
+		"""Replace the state in the file by `state`."""
+		temporary_path = self._path.with_name(self._path.name + '.tmp')
+		with open(temporary_path, 'w') as ofile:
+			json.dump(state, ofile)
+			ofile.flush()
+			os.fsync(ofile.fileno())
+		os.replace(temporary_path, self._path) # Atomic, so if we crash the file is never half written.
+	
+	def clear(self):
+		"""Delete the file."""
+		self._path.unlink(missing_ok=True)
+
+_MAXIMUM_WAIT_FOR_BUDGET_SECONDS = 10 # For messages sent explicitly by the user.
+_DELIVERY_MARGIN_SECONDS = 2 # Longer than the timeout of a request to Telegram.
+
+_TELEGRAM_MAXIMUM_MESSAGE_LENGTH = 4096 # Characters, https://core.telegram.org/bots/api#sendmessage
+_MAXIMUM_DISTINCT_WARNINGS = 50 # Kinds of warnings kept between two sends, the least recently seen are counted and forgotten.
+_MAXIMUM_WARNING_EXAMPLE_LENGTH = 1000 # Characters.
+_NUMBER_IN_WARNING = re.compile(r'(?<![\w.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?!\.?\d)') # Numbers not preceded by a letter, so `n2` or `v1.2.3` are left as they are but `1.5s` is not.
+
+class _NoBudgetError(Exception):
+	pass
+
+def _fingerprint_warning(message:str):
+	"""Groups warnings that only differ in the numbers they contain, e.g.
+	`f'The temperature is {T} °C'`.
+	
+	Returns
+	-------
+	fingerprint: str
+		The message with the numbers replaced by `#`.
+	values: list of float
+		The numbers that were replaced.
+	"""
+	values = [float(number) for number in _NUMBER_IN_WARNING.findall(message)]
+	return _NUMBER_IN_WARNING.sub('#', message), values
+
+def _truncate(text:str, length:int):
+	return text if len(text) <= length else text[:length-1] + '…'
+
+def _split_message(text:str, separator:str='\n'):
+	"""Splits `text` at `separator` into parts that Telegram accepts, 
+	truncating anything that does not fit in a single message."""
+	parts = ['']
+	for piece in text.split(separator):
+		piece = _truncate(piece, _TELEGRAM_MAXIMUM_MESSAGE_LENGTH)
+		if parts[-1] == '':
+			parts[-1] = piece
+		elif len(parts[-1]) + len(separator) + len(piece) <= _TELEGRAM_MAXIMUM_MESSAGE_LENGTH:
+			parts[-1] += separator + piece
+		else:
+			parts.append(piece)
+	return parts
+
+def _render_progress_bar(fraction:float, width:int=10):
+	n_full = min(width, max(0, int(fraction*width)))
+	return '█'*n_full + '░'*(width-n_full)
+
+_HUMANIZED_BUCKETS = [(60, 1), (60*60, 10), (24*60*60, 5*60), (float('inf'), 24*60*60)] # (below this many seconds, round to this many seconds), much finer than what `humanize` shows.
+_MAXIMUM_CACHED_HUMANIZED = 4096
+_humanized_cache = {} # {(function name, bucketed seconds): string}
+
+def _bucket_seconds(seconds:float):
+	for limit,step in _HUMANIZED_BUCKETS:
+		if abs(seconds) < limit:
+			return math.copysign(abs(seconds)//step*step + step/2, seconds) # The middle of the step, so it is never rounded to the wrong side by `humanize`.
+
+def _humanize_seconds(function_name:str, seconds:float):
+	"""Returns `humanize.<function_name>` of a time difference, cached by 
+	its value rounded to a step much smaller than the unit in which it is
+	shown, so the rendered messages do not call `humanize` each time."""
+	key = (function_name, _bucket_seconds(seconds))
+	try:
+		return _humanized_cache[key]
+	except KeyError:
+		pass
+	if len(_humanized_cache) >= _MAXIMUM_CACHED_HUMANIZED:
+		_humanized_cache.clear()
+	string = _humanized_cache[key] = getattr(humanize, function_name)(datetime.timedelta(seconds=key[1]))
+	return string
+
+def _format_minutes(moment:datetime.datetime):
+	"""The same as `moment.strftime("%Y-%m-%d %H:%M")` for the naive times
+	of `datetime.datetime.now()`, but several times faster."""
+	return moment.isoformat(sep=' ', timespec='minutes')
+
+def _naturaldelta(seconds:float):
+	return _humanize_seconds('naturaldelta', seconds)
+
+def _naturaltime(seconds:float):
+	"""`seconds` is how long ago, negative for the future."""
+	return _humanize_seconds('naturaltime', seconds)
+
+class _WarningGroup:
+	"""Warnings with the same fingerprint, see `_fingerprint_warning`."""
+	def __init__(self, message:str, values:list):
+		self.count = 1
+		self.first_example = _truncate(message, _MAXIMUM_WARNING_EXAMPLE_LENGTH)
+		self.last_example = self.first_example
+		self.minima = list(values)
+		self.maxima = list(values)
+	
+	def add(self, message:str, values:list):
+		self.count += 1
+		self.last_example = message # Truncated only when rendering, this is called in the loop.
+		self.minima = [min(a,b) for a,b in zip(self.minima,values)]
+		self.maxima = [max(a,b) for a,b in zip(self.maxima,values)]
+	
+	def render(self):
+		last_example = _truncate(self.last_example, _MAXIMUM_WARNING_EXAMPLE_LENGTH)
+		if self.count == 1:
+			return last_example
+		if last_example == self.first_example:
+			message_string = last_example
+		else:
+			message_string = f'First: {self.first_example}\nLast: {last_example}'
+		ranges = [f'{minimum:g}…{maximum:g}' for minimum,maximum in zip(self.minima,self.maxima) if minimum != maximum]
+		if len(ranges) > 0:
+			message_string += f'\nThe numbers varied within {", ".join(ranges)}.'
+		return message_string
+
+class RequestsTransport:
+	"""Delivers the messages to the Telegram API using `requests`. This
+	is the default transport of `SafeTelegramReporter`.
+	
+	A transport is any object with the methods `send_message(bot_token, **parameters)`
+	and `edit_message(bot_token, **parameters)` that do the same as the
+	functions `send_message` and `edit_message` of this module.
+	"""
+	def __init__(self, api_url:str=TELEGRAM_API_URL):
+		"""
+		Arguments
+		---------
+		api_url: str, default `TELEGRAM_API_URL`
+			Where the Telegram API is, e.g. to use a `FakeTelegramServer`.
+		"""
+		self._session = None # Created with the first request, so `requests` is not imported until something is sent.
+		self._session_lock = threading.Lock()
+		self._api_url = api_url
+	
+	def _get_session(self):
+		with self._session_lock:
+			if self._session is None:
+				self._session = requests.Session() # https://stackoverflow.com/questions/25239650/python-requests-speed-up-using-keep-alive
+			return self._session
+	
+	def send_message(self, bot_token:str, **parameters):
+		return send_message(requests_session=self._get_session(), bot_token=bot_token, api_url=self._api_url, **parameters)
+	
+	def edit_message(self, bot_token:str, **parameters):
+		return edit_message(requests_session=self._get_session(), bot_token=bot_token, api_url=self._api_url, **parameters)
 
 class SafeTelegramReporter:
 	"""A class that allows to send messages without raising any error,
-	only warnings."""
-	def __init__(self, bot_token:str, chat_id:str, **default_parameters):
+	only warnings. Nothing is sent if the environment variable 
+	`PROGRESSREPORTING_DISABLED` is set, see `is_disabled`."""
+	def __init__(self, bot_token:str, chat_id:str, transport=None, rate_limiter:TelegramRateLimiter=None, **default_parameters):
 		"""
 		Arguments
 		---------
@@ -53,6 +539,12 @@ class SafeTelegramReporter:
 			The token of the bot to use, e.g. `'123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11'`.
 		chat_id: str
 			The ID of the chat to which to send the messages to.
+		transport: optional
+			The object that actually talks to Telegram, see `RequestsTransport`.
+			If not provided, a new `RequestsTransport` is created.
+		rate_limiter: TelegramRateLimiter, optional
+			If not provided, the one shared by everyone using the same
+			bot in this process is used, see `get_rate_limiter`.
 		default_parameters:
 			Any extra parameter that will be used by default, unless overridden 
 			when calling the methods. See options in https://core.telegram.org/bots/api#sendmessage.
@@ -60,7 +552,11 @@ class SafeTelegramReporter:
 		self._bot_token = bot_token
 		self._chat_id = chat_id
 		self._default_parameters = default_parameters
-		self._session = requests.Session() # https://stackoverflow.com/questions/25239650/python-requests-speed-up-using-keep-alive
+		self._transport = transport if transport is not None else self._create_default_transport()
+		self._rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter(bot_token)
+		self._last_edited_texts = {} # The last text successfully delivered to each message, by message ID.
+		self._send_failures = 0 # Requests to Telegram that failed, including the ones that were later retried.
+		self._disabled = is_disabled()
 	
 	def send_message(self, text:str, **parameters):
 		"""Send a message, any error will be converted into a warning.
@@ -72,10 +568,7 @@ class SafeTelegramReporter:
 		**parameters:
 			Additional arguments to be passed to the Telegram API, see https://core.telegram.org/bots/api#sendmessage.
 		"""
-		try:
-			return send_message(requests_session=self._session, bot_token=self._bot_token, chat_id=self._chat_id, text=text, **{**self._default_parameters,**parameters})
-		except Exception as e:
-			warnings.warn(f'Could not send message to Telegram, reason: {repr(e)}. ')
+		return self._send_message(text, TelegramRateLimiter.PRIORITY_FINAL, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS, **parameters)
 	
 	def edit_message(self, text:str, message_id, **parameters):
 		"""Edit a message, any error will be converted into a warning.
@@ -89,27 +582,641 @@ class SafeTelegramReporter:
 		**parameters:
 			Additional arguments to be passed to the Telegram API, see https://core.telegram.org/bots/api#sendmessage.
 		"""
+		return self._edit_message(text, message_id, TelegramRateLimiter.PRIORITY_FINAL, _MAXIMUM_WAIT_FOR_BUDGET_SECONDS, **parameters)
+	
+	def _send_message(self, text:str, priority:int, wait_seconds:float, **parameters):
+		"""Send a message if there is budget for it in the rate limiter,
+		waiting at most `wait_seconds` for it. Returns the response from
+		Telegram, or `None` if it could not be sent."""
+		if self._disabled:
+			return
 		try:
-			return edit_message(requests_session=self._session, bot_token=self._bot_token, chat_id=self._chat_id, text=text, message_id=message_id, **{**self._default_parameters,**parameters})
+			return self._call_transport('send_message', priority, wait_seconds, self._parameters(text=text, **parameters))
+		except _NoBudgetError as e:
+			if priority == TelegramRateLimiter.PRIORITY_FINAL:
+				warnings.warn(f'Could not send message to Telegram, reason: {e}.')
+		except Exception as e:
+			warnings.warn(f'Could not send message to Telegram, reason: {repr(e)}. ')
+	
+	def _edit_message(self, text:str, message_id, priority:int, wait_seconds:float, **parameters):
+		"""The same as `_send_message` but for editing a message."""
+		if self._disabled:
+			return
+		if self._last_edited_texts.get(message_id) == text: # Telegram rejects edits that do not change the message, so don't even try.
+			return
+		try:
+			response = self._call_transport('edit_message', priority, wait_seconds, self._parameters(text=text, message_id=message_id, **parameters))
+			if isinstance(response, dict) and response.get('ok'): # Otherwise it was not delivered, so the same text must be tried again.
+				self._last_edited_texts[message_id] = text
+			return response
+		except _NoBudgetError as e:
+			if priority == TelegramRateLimiter.PRIORITY_FINAL:
+				warnings.warn(f'Could not edit message in Telegram, reason: {e}.')
 		except Exception as e:
 			warnings.warn(f'Could not edit message in Telegram, reason: {repr(e)}.')
 	
+	def _parameters(self, **parameters):
+		"""All the parameters for the Telegram API, including the defaults."""
+		return {'chat_id': self._chat_id, **self._default_parameters, **parameters}
+	
+	def _call_transport(self, method:str, priority:int, wait_seconds:float, parameters:dict):
+		"""Call `method` of the transport, i.e. `'send_message'` or `'edit_message'`,
+		if there is budget for it in the rate limiter. Any problem is raised."""
+		if not self._rate_limiter.acquire(parameters['chat_id'], priority, wait_seconds):
+			raise _NoBudgetError(f'no budget left in the rate limiter after waiting {wait_seconds} seconds')
+		try:
+			response = getattr(self._transport, method)(bot_token=self._bot_token, **parameters)
+		except Exception:
+			self._send_failures += 1
+			raise
+		if not isinstance(response, dict) or not response.get('ok', False):
+			self._send_failures += 1
+		self._rate_limiter.handle_response(parameters['chat_id'], response)
+		return response
+	
+	@staticmethod
+	def _create_default_transport():
+		return RequestsTransport()
+	
+class _BackgroundSender:
+	"""Runs jobs (i.e. callables without arguments) one after the other
+	in a dedicated thread, so whoever submits them never has to wait 
+	for the network."""
+	def __init__(self, queue_size:int):
+		"""
+		Arguments
+		---------
+		queue_size: int
+			Maximum number of jobs waiting to be run. If the queue is full,
+			new jobs are dropped instead of blocking the caller.
+		"""
+		self._queue = queue.Queue(maxsize=queue_size)
+		self._latest_jobs = {} # Jobs that can be coalesced, by key. Only the latest one submitted for each key is kept.
+		self._latest_jobs_lock = threading.Lock()
+		self.dropped_jobs = 0 # Jobs lost because the queue was full.
+		self.coalesced_jobs = 0 # Jobs replaced by a newer one with the same key before being run.
+		self._thread = threading.Thread(target=self._work, daemon=True) # Daemon so a network that never answers cannot prevent the program from exiting.
+		self._thread.start()
+	
+	def submit(self, job, coalesce_key=None):
+		"""Queue a job to be run in the background. Never blocks.
+		
+		Arguments
+		---------
+		job: callable
+			The job to run.
+		coalesce_key: hashable, optional
+			If given, this job replaces any job with the same key that
+			is still waiting, i.e. "last writer wins". Use it for jobs 
+			where only the newest one matters, e.g. editing the same
+			message with the current progress.
+		"""
+		if coalesce_key is None:
+			try:
+				self._queue.put_nowait(job)
+			except queue.Full:
+				self.dropped_jobs += 1
+			return
+		with self._latest_jobs_lock:
+			already_waiting = coalesce_key in self._latest_jobs
+			if already_waiting:
+				self.coalesced_jobs += 1 # The previous job is now stale, drop it.
+			self._latest_jobs[coalesce_key] = job
+			if already_waiting: # It already has its place in the queue.
+				return
+			try:
+				self._queue.put_nowait(lambda: self._run_latest(coalesce_key))
+			except queue.Full:
+				del self._latest_jobs[coalesce_key]
+				self.dropped_jobs += 1
+	
+	def _run_latest(self, coalesce_key):
+		with self._latest_jobs_lock:
+			job = self._latest_jobs.pop(coalesce_key)
+		job()
+	
+	def _work(self):
+		while True:
+			job = self._queue.get()
+			if job is None: # This is the signal to stop.
+				return
+			try:
+				job()
+			except Exception as e:
+				warnings.warn(f'A job in the background sender failed, reason: {repr(e)}')
+			finally:
+				self._queue.task_done()
+	
+	def is_idle(self):
+		"""`True` if there are no jobs waiting nor running."""
+		return self._queue.unfinished_tasks == 0
+	
+	def close(self, timeout:float):
+		"""Run all the jobs that are still waiting and stop the thread.
+		
+		Arguments
+		---------
+		timeout: float
+			Maximum number of seconds to wait. Jobs that were not run 
+			after this time are abandoned.
+		
+		Returns
+		-------
+		finished: bool
+			`True` if all the jobs were run, `False` if the timeout expired.
+		"""
+		deadline = datetime.datetime.now() + datetime.timedelta(seconds=timeout)
+		try:
+			self._queue.put(None, timeout=timeout)
+		except queue.Full:
+			return False
+		self._thread.join(max((deadline-datetime.datetime.now()).total_seconds(), 0))
+		return not self._thread.is_alive()
+
+_retry_sender = None
+_retry_sender_lock = threading.Lock()
+_retry_deadline = 0 # The latest deadline of the jobs given to `_retry_sender`, in `time.monotonic()` seconds.
+
+def _submit_retry(job, deadline:float):
+	"""Run `job` in the thread shared by all the reporters that deliver
+	their messages in the loop thread, for whatever would make the loop
+	wait, i.e. waiting for budget in the rate limiter, retrying and 
+	replaying the outbox. The jobs still pending when the program exits
+	are given until `deadline` to finish, see `_flush_retry_sender`."""
+	global _retry_sender, _retry_deadline
+	with _retry_sender_lock:
+		if _retry_sender is None:
+			_retry_sender = _BackgroundSender(queue_size=1000)
+			atexit.register(_flush_retry_sender)
+		_retry_deadline = max(_retry_deadline, deadline)
+		sender = _retry_sender
+	sender.submit(job)
+
+def _retry_sender_is_idle():
+	sender = _retry_sender
+	return sender is None or sender.is_idle()
+
+def _flush_retry_sender():
+	"""The thread is a daemon so a network that never answers cannot 
+	prevent the program from exiting, so give it time to finish."""
+	global _retry_sender
+	with _retry_sender_lock:
+		sender, _retry_sender = _retry_sender, None
+	if sender is not None and not sender.close(timeout=max(0, _retry_deadline-time.monotonic()) + _DELIVERY_MARGIN_SECONDS):
+		warnings.warn(f'Could not deliver all the messages to Telegram before exiting, they were abandoned.')
+
+class RateEstimator:
+	"""Estimates the current rate of a loop, in iterations per second,
+	from samples of its count. This is what `SafeTelegramReporter4Loops`
+	uses to compute the expected finish time. Subclasses have to implement
+	`reset`, `add` and `rate`, all of them using O(1) memory.
+	"""
+	def reset(self, time:float, count:int):
+		"""Start estimating from scratch, the loop is at `count` at `time`."""
+		raise NotImplementedError()
+	
+	def add(self, time:float, count:int):
+		"""Add a sample, i.e. the loop was at `count` at `time`."""
+		raise NotImplementedError()
+	
+	@property
+	def rate(self):
+		"""The estimated rate in iterations per second, or `None` if
+		there is not enough information yet."""
+		raise NotImplementedError()
+	
+	def get_state(self, time:float):
+		"""Returns the state of the estimator as something that can be
+		written as JSON, with all the times relative to `time`, or `None`
+		if this estimator cannot be saved. See `LoopCheckpoint`."""
+		return None
+	
+	def set_state(self, state, time:float):
+		"""Restore a state returned by `get_state`, with the times now 
+		relative to `time`."""
+		raise NotImplementedError()
+
+class AverageRateEstimator(RateEstimator):
+	"""The average rate since the loop started. Good for loops whose time
+	per iteration is always the same."""
+	def reset(self, time:float, count:int):
+		self._first_sample = (time, count)
+		self._last_sample = (time, count)
+	
+	def add(self, time:float, count:int):
+		self._last_sample = (time, count)
+	
+	def get_state(self, time:float):
+		return {'first_sample': (self._first_sample[0]-time, self._first_sample[1]), 'last_sample': (self._last_sample[0]-time, self._last_sample[1])}
+	
+	def set_state(self, state, time:float):
+		self._first_sample = (state['first_sample'][0]+time, state['first_sample'][1])
+		self._last_sample = (state['last_sample'][0]+time, state['last_sample'][1])
+	
+	@property
+	def rate(self):
+		elapsed = self._last_sample[0] - self._first_sample[0]
+		if elapsed <= 0 or self._last_sample[1] == self._first_sample[1]:
+			return None
+		return (self._last_sample[1]-self._first_sample[1])/elapsed
+
+class EWMARateEstimator(RateEstimator):
+	"""An exponentially weighted moving average of the rate, so the recent
+	past matters more than the beginning of the loop. Good for loops that
+	become faster or slower as they go, e.g. with warm up or caching."""
+	def __init__(self, half_life_seconds:float=300):
+		"""
+		Arguments
+		---------
+		half_life_seconds: float, default 300
+			The weight of what happened this number of seconds ago is
+			half the weight of what is happening now.
+		"""
+		self.half_life_seconds = half_life_seconds
+	
+	def reset(self, time:float, count:int):
+		self._last_sample = (time, count)
+		self._rate = None
+		self._weight = 0 # The sum of the weights of all the samples, it approaches 1 after some half lives.
+	
+	def add(self, time:float, count:int):
+		elapsed = time - self._last_sample[0]
+		if elapsed <= 0:
+			return
+		rate = (count-self._last_sample[1])/elapsed
+		weight = 1-2**(-elapsed/self.half_life_seconds) # Weight by time, so it does not matter how often we are sampled.
+		self._weight = self._weight*(1-weight) + weight
+		if self._rate is None:
+			self._rate = rate
+		else: # Divided by the sum of the weights, so within the first half life this is close to the average rate and the first sample does not dominate.
+			self._rate += weight/self._weight*(rate-self._rate)
+		self._last_sample = (time, count)
+	
+	def get_state(self, time:float):
+		return {'last_sample': (self._last_sample[0]-time, self._last_sample[1]), 'rate': self._rate, 'weight': self._weight}
+	
+	def set_state(self, state, time:float):
+		self._last_sample = (state['last_sample'][0]+time, state['last_sample'][1])
+		self._rate = state['rate']
+		self._weight = state.get('weight', 1) # Older checkpoints did not have it.
+	
+	@property
+	def rate(self):
+		return self._rate if self._rate != 0 else None
+
+class WindowRateEstimator(RateEstimator):
+	"""The rate during the last `window_seconds`, using a fixed number of
+	samples kept in a ring buffer."""
+	def __init__(self, window_seconds:float=600, n_samples:int=32, linear_fit:bool=False):
+		"""
+		Arguments
+		---------
+		window_seconds: float, default 600
+			Length of the window.
+		n_samples: int, default 32
+			Number of samples kept in the window.
+		linear_fit: bool, default False
+			If `True` the rate is the slope of a least squares fit of
+			the count as a function of time using all the samples in
+			the window, which is less sensitive to noise. Otherwise it 
+			is computed from the first and last samples.
+		"""
+		if n_samples < 2:
+			raise ValueError(f'`n_samples` must be at least 2, received {n_samples}.')
+		self.window_seconds = window_seconds
+		self.n_samples = n_samples
+		self.linear_fit = linear_fit
+	
+	def reset(self, time:float, count:int):
+		self._samples = [(time, count)]*self.n_samples
+		self._newest = 0 # Index of the newest sample in the ring buffer.
+		self._n_stored = 1
+	
+	def add(self, time:float, count:int):
+		if time - self._samples[(self._newest-1)%self.n_samples][0] < self.window_seconds/(self.n_samples-1): # Too close to the previous one, so just move the newest sample.
+			self._samples[self._newest] = (time, count)
+			return
+		self._newest = (self._newest+1)%self.n_samples
+		self._samples[self._newest] = (time, count)
+		self._n_stored = min(self._n_stored+1, self.n_samples)
+	
+	def get_state(self, time:float):
+		return {'samples': [(t-time, c) for t,c in self._samples], 'newest': self._newest, 'n_stored': self._n_stored}
+	
+	def set_state(self, state, time:float):
+		if len(state['samples']) != self.n_samples:
+			raise ValueError(f'The state has {len(state["samples"])} samples but this estimator uses {self.n_samples}.')
+		self._samples = [(t+time, c) for t,c in state['samples']]
+		self._newest = state['newest']
+		self._n_stored = state['n_stored']
+	
+	@property
+	def rate(self):
+		samples = [self._samples[(self._newest-k)%self.n_samples] for k in range(self._n_stored)]
+		if self.linear_fit and len(samples) > 2:
+			mean_time = sum(t for t,c in samples)/len(samples)
+			mean_count = sum(c for t,c in samples)/len(samples)
+			variance = sum((t-mean_time)**2 for t,c in samples)
+			if variance == 0:
+				return None
+			rate = sum((t-mean_time)*(c-mean_count) for t,c in samples)/variance
+		else:
+			(newest_time,newest_count),(oldest_time,oldest_count) = samples[0], samples[-1]
+			if newest_time == oldest_time:
+				return None
+			rate = (newest_count-oldest_count)/(newest_time-oldest_time)
+		return rate if rate > 0 else None
+
+class SharedLoopCounter:
+	"""A counter of loop iterations that many processes can increase at
+	the same time, e.g. the workers of a `ProcessPoolExecutor`. Each process 
+	has its own slot in shared memory, so increasing it costs the same as
+	increasing a number in a list, without any communication between the
+	processes. Use it with `SafeTelegramReporter4Loops.report_shared_loop`.
+	
+	The counter has to be given to the workers when they are created, 
+	either as an argument of `multiprocessing.Process` or with the 
+	`initializer` of a pool. Example:
+	counter = SharedLoopCounter(n_workers=8)
+	with reporter.report_shared_loop(counter, total_loop_iterations=999):
+		with ProcessPoolExecutor(8, initializer=counter.attach) as executor:
+			executor.map(do_something, range(999))
+	and inside `do_something`:
+		SharedLoopCounter.attached().update(1)
+	"""
+	def __init__(self, n_workers:int, context=None):
+		"""
+		Arguments
+		---------
+		n_workers: int
+			Maximum number of processes that will increase this counter.
+		context: optional
+			The multiprocessing context of the workers, e.g. if the pool
+			is created with `mp_context=multiprocessing.get_context('spawn')`
+			the same context has to be given here. If not provided, the 
+			default context is used.
+		"""
+		if context is None:
+			context = multiprocessing.get_context()
+		self._counts = context.RawArray('q', n_workers) # No lock needed, each process only writes into its own slot.
+		self._next_free_slot = context.Value('i', 0)
+		self._slot = None
+	
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		state['_slot'] = None # Each process has to claim its own slot.
+		return state
+	
+	def attach(self):
+		"""Make this counter available in the current process through
+		`SharedLoopCounter.attached()`. Meant to be used as the `initializer`
+		of a process pool."""
+		global _attached_shared_loop_counter
+		_attached_shared_loop_counter = self
+		if self._slot is None:
+			self._claim_slot()
+	
+	@staticmethod
+	def attached():
+		"""Returns the counter that was attached in the current process
+		with `attach`."""
+		if _attached_shared_loop_counter is None:
+			raise RuntimeError(f'No `SharedLoopCounter` was attached to this process, did you forget the `initializer=counter.attach`?')
+		return _attached_shared_loop_counter
+	
+	def _claim_slot(self):
+		with self._next_free_slot.get_lock():
+			slot = self._next_free_slot.value
+			if slot >= len(self._counts):
+				raise RuntimeError(f'This `SharedLoopCounter` was created for {len(self._counts)} workers, and all their slots are already taken.')
+			self._next_free_slot.value += 1
+		self._slot = slot
+		return slot
+	
+	def update(self, count:int=1):
+		"""Increase the count of the current process.
+		
+		Arguments
+		---------
+		count: int, default 1
+			Number of iterations to add to the count.
+		"""
+		slot = self._slot
+		if slot is None:
+			slot = self._claim_slot()
+		self._counts[slot] += count
+	
+	def counts(self):
+		"""Returns a list with the count of each worker."""
+		return self._counts[:]
+
+_attached_shared_loop_counter = None
+_loop_ids = itertools.count(1) # To tell apart the loops in the events given to the sinks.
+_active_loop_reporters = weakref.WeakSet()
+_active_loop_reporters_lock = threading.Lock()
+
+DEFAULT_PROGRESS_TEMPLATE = (
+	'🕰️ {title}\n\n'
+	'{start_time} | Started\n'
+	'{expected_finish_time} | Expected finish\n'
+	'{remaining_time} | Remaining\n\n'
+	'{progress}\n'
+	'{rates}{workers}{subloops}{extra_fields}\n'
+	'Last update of this message: {now}\n'
+	'The next update of this message should be in {update_interval}.'
+)
+
+class _MessageFields(dict):
+	"""The fields given to `str.format_map` to render the progress 
+	message from its template, see `report_loop`. The ones that change
+	are computed only if the template uses them, and only once."""
+	def __init__(self, reporter):
+		super().__init__(reporter._static_fields)
+		self.update(reporter._extra_fields)
+		self._reporter = reporter
+		self._now = datetime.datetime.now()
+	
+	def __missing__(self, key:str):
+		compute = getattr(self, f'_compute_{key}', None)
+		if compute is None:
+			raise KeyError(key)
+		value = self[key] = compute()
+		return value
+	
+	def _compute_now(self):
+		return _format_minutes(self._now)
+	
+	def _compute_count(self):
+		return self._reporter._count
+	
+	def _compute_total(self):
+		return self._reporter._total_iterations
+	
+	def _compute_percentage(self):
+		return int(self['count']/self['total']*100) if self['total'] is not None else None
+	
+	def _compute_progress(self):
+		if self['total'] is None:
+			return f'{self["count"]} iterations'
+		progress_bar = f'{_render_progress_bar(self["count"]/self["total"])} ' if len(self._reporter._subloops) > 0 else '' # Show all the levels in the same way.
+		return f'{progress_bar}{self["count"]}/{self["total"]} | {self["percentage"]} %'
+	
+	def _compute_rate(self):
+		rate = self._reporter._rate_estimator.rate
+		return rate if rate is not None else 0
+	
+	def _compute_elapsed_seconds(self):
+		return (self._now-self._reporter._start_time).total_seconds()
+	
+	def _compute_elapsed_time(self):
+		return _naturaldelta(self['elapsed_seconds'])
+	
+	def _compute_average_rate(self):
+		return self['count']/self['elapsed_seconds'] if self['elapsed_seconds'] > 0 else 0
+	
+	def _compute_rates(self):
+		return f'{self["rate"]:.3g} it/s now | {self["average_rate"]:.3g} it/s average\n'
+	
+	def _compute_expected_finish(self):
+		return self._reporter._expected_finish_time(self._now)
+	
+	def _compute_expected_finish_time(self):
+		return _format_minutes(self['expected_finish']) if self['expected_finish'] is not None else 'Unknown'
+	
+	def _compute_remaining_time(self):
+		return _naturaltime((self._now-self['expected_finish']).total_seconds()) if self['expected_finish'] is not None else 'Unknown'
+	
+	def _compute_workers(self):
+		return self._reporter._render_workers() if self._reporter._shared_counter is not None else ''
+	
+	def _compute_subloops(self):
+		return self._reporter._render_subloops()
+	
+	def _compute_extra_fields(self):
+		return ''.join(f'{field}\n' for field in self._reporter._render_extra_fields())
+
+_STATIC_MESSAGE_FIELDS = frozenset({'title', 'start_time', 'update_interval', 'warn_interval'}) # Rendered once when the loop starts, see `SafeTelegramReporter4Loops._start`.
+_MESSAGE_FIELDS = _STATIC_MESSAGE_FIELDS | {name[len('_compute_'):] for name in dir(_MessageFields) if name.startswith('_compute_')}
+
+def _format_field_value(value):
+	return f'{value:.3g}' if isinstance(value, float) else str(value)
+
+def get_active_loop_reporters():
+	"""Returns a list with all the instances of `SafeTelegramReporter4Loops`
+	that are reporting a loop right now in this process, see `SafeTelegramReporter4Loops.metrics`."""
+	with _active_loop_reporters_lock:
+		return list(_active_loop_reporters)
+
+_STRIDE_MONITOR_INTERVAL_SECONDS = 1
+_stride_monitor_thread = None
+_stride_monitor_lock = threading.Lock()
+
+def _start_stride_monitor():
+	"""Make sure that the thread running `_monitor_strides` is alive."""
+	global _stride_monitor_thread
+	with _stride_monitor_lock:
+		if _stride_monitor_thread is None:
+			_stride_monitor_thread = threading.Thread(target=_monitor_strides, name='StrideMonitor', daemon=True)
+			_stride_monitor_thread.start()
+
+def _monitor_strides():
+	"""The stride of a loop is tuned from the rate observed so far, so if
+	the iterations suddenly become much slower, e.g. after a fast warm up,
+	the next check could be hours away. This runs in a thread shared by 
+	all the loops, like the monitor of `tqdm`, and forces a check in the 
+	next call to `update` of any loop that has not checked for a whole
+	update period. It stops when there are no loops to watch."""
+	global _stride_monitor_thread
+	while True:
+		time.sleep(_STRIDE_MONITOR_INTERVAL_SECONDS)
+		with _stride_monitor_lock:
+			reporters = get_active_loop_reporters()
+			if len(reporters) == 0:
+				_stride_monitor_thread = None
+				return
+		now = time.monotonic()
+		for reporter in reporters:
+			if reporter._check_every is None and now - reporter._last_check_time > min(reporter._minimum_update_time, reporter._minimum_warn_time).total_seconds():
+				reporter._force_check()
+
 class SafeTelegramReporter4Loops(SafeTelegramReporter):
-	def __init__(self, bot_token:str, chat_id:str, **default_parameters):
+	def __init__(self, bot_token:str, chat_id:str, transport=None, rate_limiter:TelegramRateLimiter=None, send_in_background:bool=False, background_queue_size:int=100, flush_timeout_seconds:float=10, retry_policy:RetryPolicy=None, outbox:Outbox=None, sinks:list=None, **default_parameters):
+		"""
+		Arguments
+		---------
+		bot_token: str
+			The token of the bot to use, e.g. `'123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11'`.
+		chat_id: str
+			The ID of the chat to which to send the messages to.
+		transport: optional
+			See `SafeTelegramReporter`.
+		rate_limiter: TelegramRateLimiter, optional
+			See `SafeTelegramReporter`.
+		send_in_background: bool, default False
+			If `True`, all the communication with Telegram while reporting
+			a loop happens in a dedicated thread, so `update` and `warn` 
+			never wait for the network and your loop is never paused.
+		background_queue_size: int, default 100
+			Only used if `send_in_background` is `True`. Maximum number 
+			of messages waiting to be sent, if there are more they are 
+			dropped.
+		flush_timeout_seconds: float, default 10
+			When the loop finishes, maximum time to wait for the pending
+			messages to be sent, and for budget in the rate limiter and
+			retries to send the final status. If `send_in_background` is 
+			`False` the loop does not wait for this, whatever could not be
+			delivered right away is retried by a thread shared by all the 
+			reporters, which is given this time to finish when the program
+			exits.
+		retry_policy: RetryPolicy, optional
+			How to retry sending the final status of the loop if it fails.
+			If not provided, `RetryPolicy()` is used.
+		outbox: Outbox, optional
+			If provided, a final status that could not be delivered is
+			kept here and delivered, in order, as soon as the connection
+			with Telegram works again, e.g. when the next loop starts.
+		sinks: list, optional
+			Other places where to deliver the progress of the loops in 
+			addition to the Telegram chat, e.g. `[FileSink('loops.jsonl')]`
+			to keep a local log at full resolution. Each sink is throttled
+			and delivered by its own thread, so a slow one does not hold
+			back the others. See `progressreporting.ProgressSinks`.
+		default_parameters:
+			Any extra parameter that will be used by default, unless overridden 
+			when calling the methods. See options in https://core.telegram.org/bots/api#sendmessage.
+		"""
 		super().__init__(
 			bot_token = bot_token,
 			chat_id = chat_id,
+			transport = transport,
+			rate_limiter = rate_limiter,
 			**default_parameters,
 		)
 		self._now_reporting = False
+		self._count = 0
+		self._calls_until_check = 0 # With this value the first call to `update` will go through `_check`, which raises the appropriate error if we are not reporting.
+		self._send_in_background = send_in_background
+		self._background_queue_size = background_queue_size
+		self._flush_timeout_seconds = flush_timeout_seconds
+		self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+		self._outbox = outbox
+		self._sinks = list(sinks) if sinks is not None and not self._disabled else []
+		self._sender = None
+		self._parent = None # The reporter in whose message this loop is shown, see `create_subloop_reporter`.
+		self._replying_to = None # The reporter to whose message the messages of this loop reply, see `create_subloop_reporter`.
+		self._subloops = [] # The reporters of the subloops shown in the message of this loop.
+		self._extra_fields = {} # See `set_fields`.
 	
-	def report_loop(self, total_loop_iterations:int, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60):
+	def report_loop(self, total_loop_iterations:int, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60, check_every:int=None, rate_estimator:RateEstimator=None, checkpoint:LoopCheckpoint=None, message_template:str=None):
 		"""Configure the object to report a loop.
 		
 		Arguments
 		---------
-		total_loop_iterations: int
-			Total number of loop iterations expected.
+		total_loop_iterations: int or None
+			Total number of loop iterations expected. If `None`, the 
+			loop is reported as a loop of unknown length, e.g. one 
+			that consumes a generator, and there will be no percentage 
+			nor expected finish time.
 		loop_name: str, optional
 			An optional name for the loop. If not provided a default
 			name with a timestamp will be created.
@@ -122,33 +1229,100 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		minimum_warn_time_seconds: float, default 60
 			Minimum time for sending warnings. The same as for `miminum_update_time_seconds`
 			holds if this value is too small.
+		check_every: int, optional
+			Look at the clock only once every this number of calls to
+			`update`, which makes `update` much cheaper in very fast loops.
+			If not provided it is tuned automatically from the observed
+			iteration rate so that the clock is looked at about 100 times
+			per `miminum_update_time_seconds`, and if the loop suddenly
+			becomes much slower a shared thread makes sure that the clock
+			is looked at least once per `miminum_update_time_seconds`. 
+			Use `check_every=1` if the time per iteration of your loop 
+			varies wildly.
+		rate_estimator: RateEstimator, optional
+			How to estimate the rate of the loop to compute the expected
+			finish time. If not provided, `EWMARateEstimator()` is used.
+			See also `AverageRateEstimator` and `WindowRateEstimator`.
+		checkpoint: LoopCheckpoint, optional
+			If provided, the state of the loop is saved there from time
+			to time, and if it was already there, e.g. because the program
+			crashed and was restarted, the loop continues from it. See 
+			`LoopCheckpoint`.
+		message_template: str, optional
+			The template of the progress message, for `str.format`. If not
+			provided, `DEFAULT_PROGRESS_TEMPLATE` is used. The fields are 
+			`title`, `start_time`, `update_interval`, `warn_interval`, 
+			`now`, `count`, `total`, `percentage`, `progress`, `rate` and
+			`average_rate` (in it/s), `rates`, `elapsed_seconds`, 
+			`elapsed_time`, `expected_finish` (a `datetime` or `None`), 
+			`expected_finish_time`, `remaining_time`, `workers`, `subloops`,
+			`extra_fields` and those given to `set_fields`. E.g. 
+			`'{title}: {percentage} % | {rate:.1f} it/s | loss {loss:.3f}'`.
+			Only the fields used in the template are computed. A message
+			that cannot be rendered with it, e.g. because a field is not
+			given to `set_fields` yet, uses `DEFAULT_PROGRESS_TEMPLATE`.
 		"""
 		self._title = loop_name if loop_name is not None else ('Loop started on ' + datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
-		if not isinstance(total_loop_iterations, int):
-			raise TypeError(f'`total_loop_iterations` must be an integer, received object of type {type(total_loop_iterations)}.')
+		if total_loop_iterations is not None and not isinstance(total_loop_iterations, int):
+			raise TypeError(f'`total_loop_iterations` must be an integer or `None`, received object of type {type(total_loop_iterations)}.')
 		self._total_iterations = total_loop_iterations
+		if check_every is not None and (not isinstance(check_every, int) or check_every < 1):
+			raise ValueError(f'`check_every` must be a positive integer, received {repr(check_every)}.')
 		self._minimum_update_time = datetime.timedelta(seconds=miminum_update_time_seconds)
 		self._minimum_warn_time = datetime.timedelta(seconds=minimum_warn_time_seconds)
+		self._check_every = check_every
+		self._rate_estimator = rate_estimator if rate_estimator is not None else EWMARateEstimator()
+		self._checkpoint = checkpoint
+		self._message_template = message_template if message_template is not None else DEFAULT_PROGRESS_TEMPLATE
+		self._shared_counter = None
 		return self
 	
-	def create_subloop_reporter(self):
+	def create_subloop_reporter(self, in_parent_message:bool=False):
 		"""Creates a new instance of `SafeTelegramReporter4Loops` which
 		is tied to the current instance in the sense that all its messages
 		will by default answer to the current loop reporting message.
+		
+		Arguments
+		---------
+		in_parent_message: bool, default False
+			If `True`, the subloop does not send any message of its own.
+			Instead, it is shown with a progress bar in the message of 
+			the current loop while it runs, and its warnings are sent
+			as warnings of the current loop. This way a loop with many
+			nested subloops is still reported in a single message that
+			is edited once every `miminum_update_time_seconds` of the
+			outermost loop.
 		"""
 		if not self._now_reporting:
 			raise RuntimeError('You can only report a subloop if you are already reporting a loop!')
 		default_params = dict(self._default_parameters)
 		default_params.pop('reply_to_message_id',None) # If the current instance was already replying to some message, because e.g. it is already a subloop reporter, remove this!
-		subreporter = SafeTelegramReporter4Loops(
+		subreporter = type(self)( # So subclasses create subreporters of their own kind.
 			bot_token = self._bot_token,
 			chat_id = self._chat_id,
-			reply_to_message_id = self._message_id_reporting_loop_progress,
+			transport = self._transport, # Share the connections.
+			rate_limiter = self._rate_limiter,
+			send_in_background = self._send_in_background,
+			background_queue_size = self._background_queue_size,
+			flush_timeout_seconds = self._flush_timeout_seconds,
+			retry_policy = self._retry_policy,
+			outbox = self._outbox,
+			sinks = self._sinks,
 			**default_params,
 		)
+		subreporter._replying_to = self # Not the ID of the message, it may not be sent yet, e.g. with `send_in_background`.
+		if in_parent_message:
+			subreporter._parent = self
 		return subreporter
 	
-	def report_subloop(self, total_loop_iterations:int, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60):
+	def _parameters(self, **parameters):
+		if self._replying_to is not None and 'reply_to_message_id' not in parameters:
+			message_id = self._replying_to._message_id_reporting_loop_progress # Now, when the message is sent, and not when this reporter was created.
+			if message_id is not None:
+				parameters['reply_to_message_id'] = message_id
+		return super()._parameters(**parameters)
+	
+	def report_subloop(self, total_loop_iterations:int, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60, check_every:int=None, rate_estimator:RateEstimator=None, in_parent_message:bool=False, checkpoint:LoopCheckpoint=None, message_template:str=None):
 		"""Creates a new instance of `SafeTelegramReporter4Loops` which
 		will answer to the current instance and configures it to report
 		a loop, i.e. it calls the method `report_loop` on the new instance
@@ -156,70 +1330,594 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		
 		Arguments
 		---------
-		See `SafeTelegramReporter4Loops.report_loop`.
+		in_parent_message: bool, default False
+			See `SafeTelegramReporter4Loops.create_subloop_reporter`.
+		Other arguments:
+			See `SafeTelegramReporter4Loops.report_loop`.
 		
 		Returns
 		-------
 		subreporter: SafeTelegramReporter4Loops
 			A new instance that will handle the subloop.
 		"""
-		subreporter = self.create_subloop_reporter()
+		subreporter = self.create_subloop_reporter(in_parent_message=in_parent_message)
 		subreporter.report_loop(
 			total_loop_iterations = total_loop_iterations, 
 			loop_name = loop_name, 
 			miminum_update_time_seconds = miminum_update_time_seconds, 
-			minimum_warn_time_seconds = minimum_warn_time_seconds
+			minimum_warn_time_seconds = minimum_warn_time_seconds,
+			check_every = check_every,
+			rate_estimator = rate_estimator,
+			checkpoint = checkpoint,
+			message_template = message_template,
 		)
 		return subreporter
 	
+	def report_shared_loop(self, shared_counter:SharedLoopCounter, total_loop_iterations:int, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60, poll_time_seconds:float=1, rate_estimator:RateEstimator=None):
+		"""Configure the object to report a loop whose iterations are
+		done by other processes, which count them in `shared_counter`.
+		Instead of calling `update`, the count is read from `shared_counter`
+		once every `poll_time_seconds` in a background thread. The report
+		includes the progress and throughput of each worker.
+		
+		Arguments
+		---------
+		shared_counter: SharedLoopCounter
+			The counter increased by the workers.
+		poll_time_seconds: float, default 1
+			Time between consecutive readings of the counter.
+		Other arguments:
+			See `SafeTelegramReporter4Loops.report_loop`.
+		"""
+		if not isinstance(shared_counter, SharedLoopCounter):
+			raise TypeError(f'`shared_counter` must be an instance of `SharedLoopCounter`, received object of type {type(shared_counter)}.')
+		self.report_loop(
+			total_loop_iterations = total_loop_iterations,
+			loop_name = loop_name,
+			miminum_update_time_seconds = miminum_update_time_seconds,
+			minimum_warn_time_seconds = minimum_warn_time_seconds,
+			rate_estimator = rate_estimator,
+		)
+		self._shared_counter = shared_counter
+		self._poll_time_seconds = poll_time_seconds
+		return self
+	
+	def _start_polling(self):
+		self._stop_polling_event = threading.Event()
+		def poll():
+			while not self._stop_polling_event.wait(self._poll_time_seconds):
+				self._poll_shared_counter()
+		self._polling_thread = threading.Thread(target=poll, daemon=True)
+		self._polling_thread.start()
+	
+	def _stop_polling(self):
+		self._stop_polling_event.set()
+		self._polling_thread.join()
+	
+	def _poll_shared_counter(self):
+		counts = self._shared_counter.counts()
+		now = time.monotonic()
+		elapsed = now - self._last_poll_time
+		if elapsed > 0:
+			self._workers_rates = [(count-previous)/elapsed for count,previous in zip(counts,self._last_polled_counts)]
+		self._last_polled_counts = counts
+		self._last_poll_time = now
+		self._count = max(self._count, sum(counts) - sum(self._shared_counter_baseline)) # `max` so `set_completed` is respected.
+		self._check()
+	
+	def track(self, iterable, total_loop_iterations:int=None, loop_name:str=None, miminum_update_time_seconds:float=60, minimum_warn_time_seconds:float=60, check_every:int=None, rate_estimator:RateEstimator=None, checkpoint:LoopCheckpoint=None, message_template:str=None):
+		"""Report the progress of a loop over `iterable`, without having
+		to call `update` in each iteration. Example:
+		for x in reporter.track(range(99), loop_name='My loop'):
+			do_something(x)
+		
+		The items are counted in a local variable and the state of the
+		reporter is only touched once every `check_every` items, so this
+		is cheaper than calling `update(1)` in each iteration.
+		
+		If the loop is left early, e.g. with `break`, it is reported as
+		left early at the number of iterations done. If that means that
+		the loop is done, e.g. when looking for something in a generator,
+		call `reporter.set_completed()` before the `break` so it is 
+		reported as completed.
+		
+		An exception raised in the body of the loop also leaves it early,
+		and it cannot be told apart from a `break` because it never gets
+		into `track`. To have crashes reported with their reason, use
+		`with reporter.report_loop(...)` and `update` instead.
+		
+		Arguments
+		---------
+		iterable:
+			The iterable to loop over. It can be anything, including a
+			generator of unknown length.
+		total_loop_iterations: int, optional
+			Total number of loop iterations expected. If not provided, 
+			`len(iterable)` is used if available, otherwise the loop is
+			reported as a loop of unknown length. When resuming from a
+			`checkpoint`, `iterable` should have only what is left to do
+			and `total_loop_iterations` should be given.
+		Other arguments:
+			See `SafeTelegramReporter4Loops.report_loop`.
+		
+		Returns
+		-------
+		iterator:
+			An iterator that yields the same items as `iterable`.
+		"""
+		if total_loop_iterations is None:
+			try:
+				total_loop_iterations = len(iterable)
+			except TypeError: # This is the case of generators, for example.
+				pass
+		self.report_loop(
+			total_loop_iterations = total_loop_iterations,
+			loop_name = loop_name,
+			miminum_update_time_seconds = miminum_update_time_seconds,
+			minimum_warn_time_seconds = minimum_warn_time_seconds,
+			check_every = check_every,
+			rate_estimator = rate_estimator,
+			checkpoint = checkpoint,
+			message_template = message_template,
+		)
+		return self._track(iterable)
+	
+	def _track(self, iterable):
+		with self:
+			pending = 0 # Items counted but not yet added to `self._count`.
+			try:
+				for item in iterable:
+					yield item
+					pending += 1 # If we are here, the previous item was completely processed.
+					if pending >= self._calls_until_check: # Not kept in a local variable, so `_force_check` works.
+						self._count += pending
+						pending = 0
+						self._check()
+			finally:
+				self._count += pending
+	
+	def metrics(self):
+		"""Returns a snapshot of the state of the loop as a dictionary, e.g.
+		for monitoring, see `progressreporting.ProgressMetrics`. It does
+		not lock anything, so it can be called at any time from any thread
+		without slowing down the loop, but the values may be up to one 
+		check old (see `check_every` in `report_loop`)."""
+		rate = self._rate_estimator.rate
+		expected_finish_time = self.expected_finish_time
+		elapsed = (datetime.datetime.now()-self._start_time).total_seconds()
+		count = self._count
+		return {
+			'loop': self._title,
+			'loop_id': self._loop_id,
+			'count': count,
+			'total': self._total_iterations,
+			'rate': rate if rate is not None else 0,
+			'average_rate': count/elapsed if elapsed > 0 else 0,
+			'elapsed_seconds': elapsed,
+			'expected_finish_timestamp': expected_finish_time.timestamp() if expected_finish_time is not None else None,
+			'warnings': self._n_warnings,
+			'send_failures': self._send_failures,
+		}
+	
 	@property
 	def expected_finish_time(self):
-		return self._start_time + (datetime.datetime.now()-self._start_time)/self._count*self._total_iterations if self._count != 0 and self._now_reporting==True else None
+		return self._expected_finish_time(datetime.datetime.now())
+	
+	def _expected_finish_time(self, now:datetime.datetime):
+		if self._now_reporting == False or self._total_iterations is None:
+			return None
+		rate = self._rate_estimator.rate
+		if rate is None:
+			return None
+		return now + datetime.timedelta(seconds=(self._total_iterations-self._count)/rate)
 	
 	def __enter__(self):
+		self._start()
+		return self
+		
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self._finish(exc_type, exc_value)
+		if self._sender is not None:
+			self._handle_closed_sender(self._sender.close(timeout=self._time_to_close_sender()))
+		self._close_sinks()
+	
+	def _start(self):
+		"""Initialize everything to start reporting a loop. This is the 
+		part of `__enter__` that is common to all the subclasses."""
 		if self._now_reporting == True:
 			raise RuntimeError(f'This instance is already reporting a loop named {repr(self._title)}, cannot report another loop before this one is finished.')
 		self._count = 0
 		self._start_time = datetime.datetime.now()
+		self._extra_fields = {}
+		self._message_id_reporting_loop_progress = None
+		self._accumulated_warnings = collections.OrderedDict() # {fingerprint: _WarningGroup}, the least recently seen first.
+		self._forgotten_warnings = 0 # Warnings not kept because there were too many kinds of them.
+		self._n_warnings = 0
+		self._completed = False
+		now = time.monotonic()
+		self._next_update_deadline = now # So the first update is instantly reported.
+		self._next_warn_deadline = now # So the first warning is instantly sent.
+		self._last_check_time = now
+		self._rate_estimator.reset(now, 0)
+		self._stride = self._check_every if self._check_every is not None else 1
+		self._calls_until_check = self._stride
+		if self._checkpoint is not None:
+			self._resume_from_checkpoint(now)
+			self._next_checkpoint_deadline = now + self._checkpoint.minimum_save_time_seconds
+		self._static_fields = { # The parts of the messages that never change, see `_MessageFields`. Only now, because resuming from the checkpoint changes the start time.
+			'title': self._title,
+			'start_time': _format_minutes(self._start_time),
+		}
+		if not self._disabled: # Otherwise no message is ever rendered, and `humanize` must not even be imported.
+			self._static_fields['update_interval'] = _naturaldelta(self._minimum_update_time.total_seconds())
+			self._static_fields['warn_interval'] = _naturaldelta(self._minimum_warn_time.total_seconds())
+		self._sender = self._create_sender()
+		self._loop_id = next(_loop_ids)
+		self._sinks_deadlines = [now]*len(self._sinks)
+		for sink in self._sinks:
+			sink.open()
+		self._emit('loop_started', total=self._total_iterations)
+		with _active_loop_reporters_lock:
+			_active_loop_reporters.add(self)
+		if self._check_every is None and not self._disabled:
+			_start_stride_monitor()
+		if self._shared_counter is not None:
+			self._shared_counter_baseline = self._shared_counter.counts() # In case the counter was used before.
+			self._last_polled_counts = self._shared_counter_baseline
+			self._last_poll_time = time.monotonic()
+			self._workers_rates = [0]*len(self._last_polled_counts)
+		self._starting_message_sent = threading.Event() # The subloops replying to this message wait for it, see `_deliver_starting_message`.
+		if self._parent is not None: # Everything goes into the message of the parent.
+			self._parent._subloops.append(self)
+		elif self._message_id_reporting_loop_progress is None and not self._disabled: # Otherwise it was resumed from a checkpoint, and the same message is edited.
+			self._deliver(self._deliver_starting_message, self._render_starting_message())
+			if self._count == 0: # Without a sender it was delivered right now, and that time is not part of the loop.
+				self._rate_estimator.reset(time.monotonic(), 0)
+		if self._sender is None or self._message_id_reporting_loop_progress is not None: # Otherwise the sender sets it once it tried to send the message.
+			self._starting_message_sent.set()
+		self._now_reporting = True
+		if self._shared_counter is not None:
+			self._start_polling()
+	
+	def _finish(self, exc_type, exc_value):
+		"""Send the final status of the loop and stop reporting. This is
+		the part of `__exit__` that is common to all the subclasses."""
+		if self._shared_counter is not None:
+			self._stop_polling()
+			self._count = max(self._count, sum(self._shared_counter.counts()) - sum(self._shared_counter_baseline))
+		self._final_deadline = time.monotonic() + self._flush_timeout_seconds
+		self._rate_estimator.add(time.monotonic(), self._count)
+		self._emit(
+			'loop_finished',
+			count = self._count,
+			total = self._total_iterations,
+			completed = self._is_completed(exc_type),
+			reason = 'left the loop early' if exc_type is GeneratorExit else repr(exc_value) if exc_value is not None else None,
+			elapsed_seconds = (datetime.datetime.now()-self._start_time).total_seconds(),
+		)
 		try:
-			response = self.send_message(
-				f'🕰️ Starting "{self._title}"...\nToday/now it is {self._start_time.strftime("%Y-%m-%d %H:%M")}\nThe next update of this message should be in {humanize.naturaldelta(self._minimum_update_time)} or the time it takes for the loop to complete one iteration, whatever happens first.'
-			)
-			self._message_id_reporting_loop_progress = response['result']['message_id']
+			if self._parent is not None:
+				self._parent._subloops.remove(self)
+			elif not self._disabled:
+				self._send_warnings(force=True) # If there are warnings accumulated, sent them.
+				self._deliver(self._deliver_final_message, self._render_final_message(exc_type, exc_value))
+			if self._checkpoint is not None:
+				self._deliver(self._write_checkpoint, None if self._is_completed(exc_type) else self._checkpoint_state()) # Keep it only if there is something left to do.
 		except Exception as e:
 			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
-		self._now_reporting = True
-		return self
-		
-	def __exit__(self, exc_type, exc_value, exc_traceback):
+		finally:
+			self._now_reporting = False
+			self._calls_until_check = 0 # So `update` goes through `_check` and complains.
+			with _active_loop_reporters_lock:
+				_active_loop_reporters.discard(self)
+	
+	def _checkpoint_state(self):
+		return {
+			'loop': self._title,
+			'total': self._total_iterations,
+			'count': self._count,
+			'start_time': self._start_time.isoformat(),
+			'chat_id': self._chat_id,
+			'message_id': self._message_id_reporting_loop_progress,
+			'rate_estimator': self._rate_estimator.get_state(time.monotonic()),
+			'saved_on': datetime.datetime.now().isoformat(timespec='seconds'),
+		}
+	
+	def _write_checkpoint(self, state:dict):
+		"""Save `state` in the checkpoint or, if `None`, delete it."""
 		try:
-			self._send_warnings(force=True) # If there are warnings accumulated, sent them.
-			
-			message_string = f'{self._title}\n\n'
-			if self._count < self._total_iterations:
-				message_string += f'💥 FINISHED WITHOUT REACHING 100 %\n\n'
-				message_string += f'Reason: {repr(exc_value)}\n\n'
+			if state is None:
+				self._checkpoint.clear()
 			else:
-				message_string = '✅ ' + message_string
-			message_string += f'Finished on {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}\n'
-			message_string += f'Total elapsed time: {humanize.naturaldelta(datetime.datetime.now()-self._start_time)}\n'
-			if self._count != self._total_iterations:
-				message_string += f'Progress: {self._count} iterations ({int(self._count/self._total_iterations*100)} %)\n'
-				if self.expected_finish_time is not None:
-					message_string += f'Expected missing time: {humanize.naturaldelta(datetime.datetime.now()-self.expected_finish_time)}\n'
-			
-			self.edit_message(
-				text = message_string,
-				message_id = self._message_id_reporting_loop_progress,
-			)
-			self.send_message(
-				text = 'Finished!',
-				reply_to_message_id = self._message_id_reporting_loop_progress,
-			)
+				self._checkpoint.save(state)
+		except Exception as e:
+			warnings.warn(f'Could not write the checkpoint of the loop. Reason: {repr(e)}')
+	
+	def _resume_from_checkpoint(self, now:float):
+		state = self._checkpoint.load()
+		if state is None or state.get('loop') != self._title or state.get('total') != self._total_iterations: # It is not from this loop.
+			return
+		self._count = state['count']
+		self._start_time = datetime.datetime.fromisoformat(state['start_time'])
+		if state['chat_id'] == self._chat_id:
+			self._message_id_reporting_loop_progress = state['message_id']
+		self._rate_estimator.reset(now, self._count)
+		if state['rate_estimator'] is not None:
+			try:
+				self._rate_estimator.set_state(state['rate_estimator'], now) # As if no time passed since it was saved, the loop was not running meanwhile.
+			except Exception as e:
+				self._rate_estimator.reset(now, self._count)
+				warnings.warn(f'Could not restore the rate estimator from the checkpoint, it starts from scratch. Reason: {repr(e)}')
+	
+	@property
+	def completed_iterations(self):
+		"""The number of iterations counted so far, including the ones
+		restored from a `LoopCheckpoint`."""
+		return self._count
+	
+	def _create_sender(self):
+		"""Returns the object that will deliver the messages in background,
+		or `None` to deliver them right away."""
+		if self._send_in_background and self._parent is None and not self._disabled: # Subloops in the message of the parent never send anything.
+			return _BackgroundSender(queue_size=self._background_queue_size)
+		return None
+	
+	def _time_to_close_sender(self):
+		return max(0, self._final_deadline-time.monotonic()) + _DELIVERY_MARGIN_SECONDS # Give the last attempt time to end up in the outbox.
+	
+	def _handle_closed_sender(self, finished:bool):
+		if not finished:
+			warnings.warn(f'Could not send all the pending messages to Telegram within {self._flush_timeout_seconds} seconds, they were abandoned.')
+		if self._sender.dropped_jobs > 0:
+			warnings.warn(f'{self._sender.dropped_jobs} messages were not sent to Telegram because the queue of the background sender was full.')
+		self._sender = None
+	
+	def _close_sinks(self):
+		for sink in self._sinks:
+			if not sink.close(timeout=self._time_to_close_sender()):
+				warnings.warn(f'Could not deliver all the events to {type(sink).__name__} within {self._flush_timeout_seconds} seconds, they were abandoned.')
+	
+	def _emit(self, event:str, **fields):
+		"""Give an event to all the sinks, see `progressreporting.ProgressSinks.Sink`."""
+		if len(self._sinks) == 0:
+			return
+		event = {
+			'event': event,
+			'loop': self._title,
+			'loop_id': self._loop_id,
+			'time': datetime.datetime.now().isoformat(timespec='seconds'),
+			**fields,
+		}
+		for sink in self._sinks:
+			sink.handle(event)
+	
+	def _emit_progress(self, now:float):
+		"""Give a progress event to the sinks that are due for one."""
+		due = [n for n,deadline in enumerate(self._sinks_deadlines) if now >= deadline]
+		if len(due) == 0:
+			return
+		expected_finish_time = self.expected_finish_time
+		rate = self._rate_estimator.rate
+		event = {
+			'event': 'progress',
+			'loop': self._title,
+			'loop_id': self._loop_id,
+			'time': datetime.datetime.now().isoformat(timespec='seconds'),
+			'count': self._count,
+			'total': self._total_iterations,
+			'rate': rate if rate is not None else 0,
+			'expected_finish': expected_finish_time.isoformat(timespec='seconds') if expected_finish_time is not None else None,
+		}
+		for n in due:
+			self._sinks[n].handle(event)
+			self._sinks_deadlines[n] = now + self._sinks[n].minimum_update_time_seconds
+	
+	def _render_starting_message(self):
+		return f'🕰️ Starting "{self._title}"...\nToday/now it is {self._static_fields["start_time"]}\nThe next update of this message should be in {self._static_fields["update_interval"]} or the time it takes for the loop to complete one iteration, whatever happens first.'
+	
+	def _is_completed(self, exc_type):
+		if self._total_iterations is None: # There is no way of knowing, so just trust that if there was no error it was completed.
+			return self._completed or exc_type is None
+		return self._count >= self._total_iterations
+	
+	def _render_final_message(self, exc_type, exc_value):
+		completed = self._is_completed(exc_type)
+		message_string = f'{self._title}\n\n'
+		if completed:
+			message_string = '✅ ' + message_string
+		elif exc_type is GeneratorExit: # The loop over `track` was left early, either with `break` or because of an exception in its body, there is no way to know.
+			message_string = '⏹️ ' + message_string
+			message_string += f'LEFT THE LOOP EARLY after {self._count} iterations\n\n'
+		else:
+			message_string += f'💥 FINISHED WITHOUT REACHING 100 %\n\n'
+			message_string += f'Reason: {repr(exc_value)}\n\n'
+		now = datetime.datetime.now()
+		message_string += f'Finished on {_format_minutes(now)}\n'
+		message_string += f'Total elapsed time: {_naturaldelta((now-self._start_time).total_seconds())}\n'
+		if self._total_iterations is None:
+			message_string += f'Progress: {self._count} iterations\n'
+		elif self._count != self._total_iterations:
+			message_string += f'Progress: {self._count} iterations ({int(self._count/self._total_iterations*100)} %)\n'
+			expected_finish_time = self._expected_finish_time(now)
+			if expected_finish_time is not None:
+				message_string += f'Expected missing time: {_naturaldelta((now-expected_finish_time).total_seconds())}\n'
+		message_string += ''.join(f'{field}\n' for field in self._render_extra_fields())
+		return message_string
+	
+	def _deliver(self, function, *args, coalesce_key=None):
+		"""Call `function(*args)` right now or, if sending in background,
+		queue it to be called by the background sender. See `_BackgroundSender.submit`
+		for `coalesce_key`."""
+		root = self
+		while root._parent is not None: # Subloops in the message of the parent use its sender.
+			root = root._parent
+		if root._sender is None:
+			function(*args)
+		else:
+			root._sender.submit(lambda: function(*args), coalesce_key=coalesce_key)
+	
+	def _deliver_starting_message(self, text:str):
+		try:
+			if self._sender is None: # We are in the loop thread, so don't wait for budget in the rate limiter. If there is none, the first progress report sends the message.
+				try:
+					response = self._call_transport('send_message', TelegramRateLimiter.PRIORITY_FINAL, 0, self._parameters(text=text))
+				except _NoBudgetError:
+					return
+				self._message_id_reporting_loop_progress = response['result']['message_id']
+			else:
+				if self._replying_to is not None: # We are in the background, so wait for the message of the parent to reply to it.
+					self._replying_to._starting_message_sent.wait(self._flush_timeout_seconds)
+				try:
+					response = self._send_message(text, TelegramRateLimiter.PRIORITY_FINAL, self._flush_timeout_seconds)
+					self._message_id_reporting_loop_progress = response['result']['message_id']
+				finally:
+					self._starting_message_sent.set()
+		except Exception as e:
+			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+		else: # The connection works, so deliver whatever was left from before.
+			deadline = time.monotonic() + self._flush_timeout_seconds
+			if self._sender is not None:
+				self._replay_outbox(deadline)
+			elif self._outbox is not None and len(self._outbox.pending(self._bot_token)) > 0: # We are in the loop thread, which must not wait for it.
+				_submit_retry(lambda: self._replay_outbox(deadline), deadline)
+	
+	def _deliver_progress(self, text:str):
+		try:
+			if self._message_id_reporting_loop_progress is not None: # This should be the standard case, unless the message could not be sent in the __enter__ method.
+				response = self._edit_message(text, self._message_id_reporting_loop_progress, TelegramRateLimiter.PRIORITY_PROGRESS, 0) # Never wait, there will be another progress report soon.
+			else: # If there was a problem in the __enter__ method while sending the message, let's send it now so later on we can edit it.
+				response = self._send_message(text, TelegramRateLimiter.PRIORITY_PROGRESS, 0)
+				if response is not None:
+					self._message_id_reporting_loop_progress = response['result']['message_id']
+		except Exception as e:
+			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+		else:
+			if response is not None and self._sender is not None: # The connection works and we are not in the hot loop, so deliver whatever was left from before.
+				self._replay_outbox(deadline=time.monotonic()+self._flush_timeout_seconds)
+	
+	def _deliver_final_message(self, text:str):
+		if self._sender is None: # We are in the loop thread.
+			self._deliver_final_message_now(text)
+		else:
+			self._deliver_final_message_reliably(text, self._message_id_reporting_loop_progress, self._final_deadline)
+	
+	def _deliver_final_message_reliably(self, text:str, message_id, deadline:float):
+		try:
+			if message_id is None: # The progress message was never sent, so there is nothing to edit.
+				response = self._deliver_reliably('send_message', self._parameters(text=text), deadline)
+				if response is None: # It went to the outbox, if any.
+					return
+				message_id = response['result']['message_id']
+			else:
+				self._deliver_reliably('edit_message', self._parameters(text=text, message_id=message_id), deadline)
+			self._deliver_reliably('send_message', self._parameters(text='Finished!', reply_to_message_id=message_id), deadline)
 		except Exception as e:
 			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+	
+	def _deliver_final_message_now(self, text:str):
+		"""Deliver the final status from the loop thread, e.g. when a 
+		subloop ends, so without waiting for anything. What cannot be 
+		delivered right away is retried by `_submit_retry`."""
+		message_id = self._message_id_reporting_loop_progress
+		deadline = self._final_deadline
+		if _retry_sender_is_idle() and (self._outbox is None or len(self._outbox.pending(self._bot_token)) == 0): # Otherwise it has to go after the older messages.
+			if message_id is None:
+				response = self._try_to_deliver_now('send_message', self._parameters(text=text))
+				if response is not None:
+					message_id = response['result']['message_id']
+			else:
+				response = self._try_to_deliver_now('edit_message', self._parameters(text=text, message_id=message_id))
+			if response is not None:
+				reply = self._parameters(text='Finished!', reply_to_message_id=message_id)
+				if self._try_to_deliver_now('send_message', reply) is None:
+					_submit_retry(lambda: self._deliver_reliably('send_message', reply, deadline), deadline)
+				return
+		_submit_retry(lambda: self._deliver_final_message_reliably(text, message_id, deadline), deadline)
+	
+	def _try_to_deliver_now(self, method:str, parameters:dict):
+		"""Call `method` of the transport once, only if there is budget
+		for it right now. Returns the response if it was delivered, or
+		`None` otherwise."""
+		try:
+			response = self._call_transport(method, TelegramRateLimiter.PRIORITY_FINAL, 0, parameters)
+		except Exception:
+			return None
+		return response if isinstance(response, dict) and response.get('ok') else None
+	
+	def _deliver_reliably(self, method:str, parameters:dict, deadline:float):
+		"""Call `method` of the transport retrying according to `self._retry_policy`
+		until `deadline`, in `time.monotonic()` seconds. Older messages in
+		the outbox are delivered first, and if this one cannot be delivered 
+		it goes to the outbox.
+		
+		Returns
+		-------
+		response: dict or None
+			The response from Telegram, or `None` if it could not be delivered.
+		"""
+		if not self._replay_outbox(deadline): # This message has to wait for the older ones.
+			self._outbox.append(self._bot_token, method, parameters)
+			return
+		reason = 'no time left'
+		for delay in self._retry_policy.delays():
+			if time.monotonic() + delay >= deadline:
+				break
+			time.sleep(delay)
+			try:
+				response = self._call_transport(method, TelegramRateLimiter.PRIORITY_FINAL, max(0, deadline-time.monotonic()), parameters)
+			except Exception as e:
+				reason = repr(e)
+				continue
+			if not _is_worth_retrying(response):
+				return response
+			reason = repr(response)
+		self._give_up_delivering(method, parameters, reason)
+	
+	def _give_up_delivering(self, method:str, parameters:dict, reason:str):
+		if self._outbox is not None:
+			self._outbox.append(self._bot_token, method, parameters)
+			warnings.warn(f'Could not deliver a message to Telegram, it was kept in the outbox to be delivered later. Reason: {reason}')
+		else:
+			warnings.warn(f'Could not deliver a message to Telegram after retrying. Reason: {reason}')
+	
+	def _replay_outbox(self, deadline:float):
+		"""Try to deliver the messages in the outbox, in order.
+		
+		Returns
+		-------
+		empty: bool
+			`True` if there are no messages left in the outbox for this
+			bot, `False` otherwise.
+		"""
+		if self._outbox is None:
+			return True
+		pending = self._outbox.pending(self._bot_token)
+		if len(pending) == 0:
+			return True
+		if not self._outbox.replaying.acquire(blocking=False): # Someone else is delivering them.
+			return False
+		try:
+			n_delivered = 0
+			for method, parameters in pending:
+				try:
+					response = self._call_transport(method, TelegramRateLimiter.PRIORITY_FINAL, max(0, deadline-time.monotonic()), parameters)
+				except Exception:
+					break
+				if _is_worth_retrying(response):
+					break
+				n_delivered += 1
+			self._outbox.remove(self._bot_token, n_delivered)
+			return n_delivered == len(pending)
 		finally:
-			self._now_reporting = False
+			self._outbox.replaying.release()
+	
+	def _deliver_warnings(self, text:str, wait_seconds:float):
+		return self._send_message(
+			text,
+			TelegramRateLimiter.PRIORITY_WARNING,
+			wait_seconds,
+			reply_to_message_id = self._message_id_reporting_loop_progress,
+		)
 	
 	def set_completed(self):
 		"""Sets the total number of iterations as complete, even if the
@@ -233,7 +1931,9 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 			reporter.update(1)"""
 		if self._now_reporting == False:
 			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
-		self._count = self._total_iterations
+		self._completed = True
+		if self._total_iterations is not None:
+			self._count = self._total_iterations
 	
 	def count(self, count):
 		"""This method increases the count of the loop by certain amount
@@ -243,7 +1943,7 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		if self._now_reporting == False:
 			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
 		self._count += count
-		if self._count > self._total_iterations:
+		if self._total_iterations is not None and self._count > self._total_iterations:
 			self.warn(f'The iterations count has surpassed the number of iterations expected. The number of iterations expected was {self._total_iterations} and now I have already counted {self._count} iterations.')
 	
 	def report(self):
@@ -252,54 +1952,105 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		reason you want to force the report."""
 		if self._now_reporting == False:
 			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
-		message_string = f'🕰️ {self._title}\n\n'
-		message_string += f'{self._start_time.strftime("%Y-%m-%d %H:%M")} | Started\n'
-		if self.expected_finish_time is not None:
-			message_string += f'{self.expected_finish_time.strftime("%Y-%m-%d %H:%M")} | Expected finish\n'
-			message_string += f'{humanize.naturaltime(datetime.datetime.now()-self.expected_finish_time)} | Remaining\n'
-		else:
-			message_string += f'Unknown | Expected finish\n'
-			message_string += f'Unknown | Remaining\n'
-		message_string += '\n'
-		message_string += f'{self._count}/{self._total_iterations} | {int(self._count/self._total_iterations*100)} %'
-		message_string += '\n'
-		message_string += '\n'
-		message_string += f'Last update of this message: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}\n'
-		message_string += f'The next update of this message should be in {humanize.naturaldelta(self._minimum_update_time)}.'
+		if self._parent is not None: # This loop is shown in the message of the parent.
+			self._parent.report()
+			return
+		if self._disabled:
+			return
+		self._deliver(self._deliver_progress, self._render_progress(), coalesce_key='progress') # Only the newest progress is worth sending.
+	
+	def _report_for_subloop(self):
+		"""Called by the subloops shown in the message of this loop when
+		they have something new, the message is edited only if it is
+		time to, so it does not matter how many subloops there are."""
+		if self._parent is not None:
+			self._parent._report_for_subloop()
+		elif time.monotonic() >= self._next_update_deadline:
+			self.report()
+			self._next_update_deadline = time.monotonic() + self._minimum_update_time.total_seconds()
+	
+	def _render_progress(self):
+		fields = _MessageFields(self)
 		try:
-			if hasattr(self, '_message_id_reporting_loop_progress'): # This should be the standard case, unless the message could not be sent in the __enter__ method.
-				self.edit_message(
-					text = message_string,
-					message_id = self._message_id_reporting_loop_progress,
-				)
-			else: # If there was a problem in the __enter__ method while sending the message, let's send it now so later on we can edit it.
-				response = self.send_message(message_string)
-				self._message_id_reporting_loop_progress = response['result']['message_id']
-		except Exception as e:
-			warnings.warn(f'Could not establish connection with Telegram to send the progress status. Reason: {repr(e)}')
+			return self._message_template.format_map(fields)
+		except Exception as e: # E.g. a field not given to `set_fields` yet, so the template is tried again the next time.
+			warnings.warn(f'Could not render the progress message of {repr(self._title)} with the template given, the default one was used for this message. Reason: {repr(e)}')
+			return DEFAULT_PROGRESS_TEMPLATE.format_map(fields)
+	
+	def _render_extra_fields(self):
+		"""Returns a list with a `'name: value'` for each field given to `set_fields`."""
+		return [f'{name}: {_format_field_value(value)}' for name,value in list(self._extra_fields.items())] # A copy, in case another thread sets fields meanwhile.
 	
-	def update(self, count:int):
+	def set_fields(self, **fields):
+		"""Set extra fields to show in the progress message, e.g. custom
+		metrics like `reporter.set_fields(loss=.123, accuracy=.97)`. With
+		the default template they are shown one per line after the rates,
+		with a `message_template` they are used by name, see `report_loop`.
+		They are also shown in the final message, and they are forgotten
+		when the next loop starts. Setting them does not report anything,
+		they are shown in the next report.
+		"""
+		if self._now_reporting == False:
+			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
+		for name in fields:
+			if name in _MESSAGE_FIELDS:
+				raise ValueError(f'{repr(name)} is already a field of the message, choose another name.')
+		self._extra_fields.update(fields)
+	
+	def _force_check(self):
+		"""Make the next call to `update` go through `_check`. This is 
+		called from another thread, see `_monitor_strides`."""
+		self._calls_until_check = 0
+	
+	def update(self, count:int=1):
 		"""Update the progress of the loop and automatically report to the
 		Telegram chat.
 		
 		Arguments
 		---------
-		count: int
+		count: int, default 1
 			Number of loops to add to the count. Normally you call this
 			method once per loop iteration and so `count=1` should be
 			the correct value. If you call this method once every `N`
 			iterations, then you have to use `count=N`.
 		"""
+		# This method is called in the hot loop, so it has to be as cheap as possible. Everything else happens in `_check`, once every `self._stride` calls.
+		self._count += count
+		self._calls_until_check -= 1
+		if self._calls_until_check <= 0:
+			self._check()
+	
+	def _check(self):
+		"""Do all the things that `update` needs to do but which are too
+		expensive to do in every iteration, i.e. look at the clock, report
+		and send warnings if it is time to, and tune the number of calls
+		to `update` between consecutive calls to this method."""
 		if self._now_reporting == False:
 			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
-		if not isinstance(count, int):
-			raise TypeError(f'<count> must be an integer number, received object of type {type(count)}.')
-		if not hasattr(self, '_last_update'):
-			self._last_update = datetime.datetime.now() - 2*self._minimum_update_time
-		self.count(count)
-		if datetime.datetime.now() - self._last_update >= self._minimum_update_time:
-			self.report()
-			self._last_update = datetime.datetime.now()
+		if not isinstance(self._count, int): # Checking the type of the count here instead of in `update` is much cheaper, and as soon as a non integer is added the count stops being an integer forever.
+			raise TypeError(f'<count> must be an integer number, received object of type {type(self._count)}.')
+		now = time.monotonic()
+		if self._check_every is None: # Tune the stride such that this method is called about 100 times per update period.
+			check_period = min(self._minimum_update_time, self._minimum_warn_time).total_seconds()/100
+			elapsed = now - self._last_check_time
+			if elapsed > 0:
+				self._stride = max(1, min(int(self._stride*check_period/elapsed), 2*self._stride)) # Don't let it grow too fast, in case the iteration rate drops suddenly.
+		self._last_check_time = now
+		self._calls_until_check = self._stride
+		self._rate_estimator.add(now, self._count)
+		if self._total_iterations is not None and self._count > self._total_iterations:
+			self._warn(f'The iterations count has surpassed the number of iterations expected. The number of iterations expected was {self._total_iterations} and now I have already counted {self._count} iterations.')
+		if now >= self._next_update_deadline:
+			if self._parent is None:
+				self.report()
+			else:
+				self._parent._report_for_subloop()
+			self._next_update_deadline = time.monotonic() + self._minimum_update_time.total_seconds()
+		if len(self._sinks) > 0:
+			self._emit_progress(now)
+		if self._checkpoint is not None and now >= self._next_checkpoint_deadline:
+			self._next_checkpoint_deadline = now + self._checkpoint.minimum_save_time_seconds
+			self._deliver(self._write_checkpoint, self._checkpoint_state(), coalesce_key=('checkpoint',self._loop_id)) # In background if possible, only the newest state is worth writing.
 		self._send_warnings()
 	
 	def warn(self, message:str):
@@ -316,14 +2067,28 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		message: str
 			Warning message.
 		"""
+		self._warn(message)
+	
+	def _warn(self, message:str):
 		if self._now_reporting == False:
 			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
-		if not hasattr(self, '_accumulated_warnings'):
-			self._accumulated_warnings = {}
-		if message not in self._accumulated_warnings:
-			self._accumulated_warnings[message] = 1
+		self._n_warnings += 1
+		if self._disabled:
+			return
+		if self._parent is not None: # Warnings of subloops shown in the message of the parent are warnings of the parent.
+			self._parent._warn(f'{self._title}: {message}')
+			return
+		self._emit('warning', message=message)
+		fingerprint, values = _fingerprint_warning(message)
+		group = self._accumulated_warnings.get(fingerprint)
+		if group is None:
+			self._accumulated_warnings[fingerprint] = _WarningGroup(message, values)
+			if len(self._accumulated_warnings) > _MAXIMUM_DISTINCT_WARNINGS: # Keep the memory bounded in warning storms.
+				_, forgotten = self._accumulated_warnings.popitem(last=False)
+				self._forgotten_warnings += forgotten.count
 		else:
-			self._accumulated_warnings[message] += 1 # Increase the count for this type of warning, in case it is reported multiple times within the "minimum warn time".
+			group.add(message, values) # Increase the count for this type of warning, in case it is reported multiple times within the "minimum warn time".
+			self._accumulated_warnings.move_to_end(fingerprint)
 		self._send_warnings()
 		
 	def _send_warnings(self, force:bool=False):
@@ -337,30 +2102,167 @@ class SafeTelegramReporter4Loops(SafeTelegramReporter):
 		force: bool, default False
 			Force sending the warnings no matter if they will spam the chat.
 		"""
-		if not hasattr(self, '_accumulated_warnings') or len(self._accumulated_warnings) == 0: # Nothing to send...
+		if len(self._accumulated_warnings) == 0: # Nothing to send...
 			return
-		if not hasattr(self, '_last_warn_time'):
-			self._last_warn_time = datetime.datetime.now() - 2*self._minimum_warn_time # Initialize it like this so the first warning is instantly sent.
-		if datetime.datetime.now() - self._last_warn_time >= self._minimum_warn_time or force==True: # Send warnings.
-			self._last_warn_time = datetime.datetime.now()
-			if len(self._accumulated_warnings) == 1: # There is only a single warning to show, print a simple message easy to read.
-				message2send = list(self._accumulated_warnings.keys())[0] # This is the message of the warning.
-				if self._accumulated_warnings[message2send] > 1: # This means that the warning was "raised" multiple times. We have to inform this!
-					message2send += f'\n\nThis warning happened {self._accumulated_warnings[message2send]} in the last {humanize.naturaldelta(self._minimum_warn_time)}.'
-			else: # This means that there are multiple warnings waiting to be sent.
-				message2send = f'Multiple warnings were accumulated in the last {humanize.naturaldelta(self._minimum_warn_time)}:'
-				for msg, count in self._accumulated_warnings.items():
-					message2send += '\n----\n'
-					message2send += msg
-					if count > 1:
-						message2send += f'\nThis warning happened {count} times.'
-			if not hasattr(self, '_message_id_reporting_loop_progress'): # This means that the original message was not yet sent. We just wait, sooner or later it will be sent. And we cannot do anything anyway...
+		now = time.monotonic()
+		if now >= self._next_warn_deadline or force==True: # Send warnings.
+			self._next_warn_deadline = now + self._minimum_warn_time.total_seconds()
+			if self._message_id_reporting_loop_progress is None and self._sender is None: # This means that the original message was not yet sent. We just wait, sooner or later it will be sent. And we cannot do anything anyway... With a sender the warnings are queued after it, so they are fine.
 				return
+			messages2send = self._render_warnings()
 			try:
-				self.send_message(
-					text = message2send,
-					reply_to_message_id = self._message_id_reporting_loop_progress,
-				)
-				self._accumulated_warnings = {} # Delete all warnings after having sent them.
+				if self._sender is None and not force: # We are in the loop, so don't wait for budget in the rate limiter and keep the warnings for the next time if there is none.
+					if self._deliver_warnings(messages2send[0], 0) is None:
+						return
+					for message2send in messages2send[1:]:
+						self._deliver_warnings(message2send, 0)
+				elif self._sender is None: # The loop is finishing, but we are still in its thread, so whatever cannot be sent right away waits in another one.
+					deadline = time.monotonic() + self._flush_timeout_seconds
+					for message2send in messages2send:
+						if not _retry_sender_is_idle() or self._deliver_warnings(message2send, 0) is None: # Otherwise it would go before older ones.
+							_submit_retry(
+								lambda text=message2send, message_id=self._message_id_reporting_loop_progress: self._send_message(text, TelegramRateLimiter.PRIORITY_WARNING, max(0, deadline-time.monotonic()), reply_to_message_id=message_id),
+								deadline,
+							)
+				else:
+					for message2send in messages2send:
+						self._deliver(self._deliver_warnings, message2send, self._flush_timeout_seconds)
+				self._accumulated_warnings = collections.OrderedDict() # Delete all warnings after having sent them.
+				self._forgotten_warnings = 0
 			except Exception as e:
 				warnings.warn(f'Could not establish connection with Telegram to send the warnings. Reason: {repr(e)}')
+	
+	def _render_workers(self):
+		message_string = f'{sum(self._workers_rates):.3g} it/s | {len(self._workers_rates)} workers\n'
+		for n_worker,(count,baseline,rate) in enumerate(zip(self._last_polled_counts,self._shared_counter_baseline,self._workers_rates)):
+			message_string += f'#{n_worker}: {count-baseline} | {rate:.3g} it/s\n'
+		return message_string
+	
+	def _render_subloops(self, depth:int=0):
+		message_string = ''
+		for subloop in list(self._subloops): # A copy, in case a subloop in another thread finishes meanwhile.
+			indentation = '    '*depth
+			if subloop._total_iterations is None:
+				message_string += f'{indentation}↳ {subloop._title}\n'
+				message_string += f'{indentation}    {subloop._count} iterations'
+			else:
+				message_string += f'{indentation}↳ {_render_progress_bar(subloop._count/subloop._total_iterations)} {subloop._title}\n'
+				message_string += f'{indentation}    {subloop._count}/{subloop._total_iterations} | {int(subloop._count/subloop._total_iterations*100)} %'
+			now = datetime.datetime.now()
+			expected_finish_time = subloop._expected_finish_time(now)
+			if expected_finish_time is not None:
+				message_string += f' | {_naturaldelta((expected_finish_time-now).total_seconds())} remaining'
+			if len(subloop._extra_fields) > 0:
+				message_string += f'\n{indentation}    ' + ' | '.join(subloop._render_extra_fields())
+			message_string += '\n'
+			message_string += subloop._render_subloops(depth+1)
+		return message_string
+	
+	def _render_warnings(self):
+		"""Returns a list with the messages to send, each of them short
+		enough for Telegram."""
+		if len(self._accumulated_warnings) == 1 and self._forgotten_warnings == 0: # There is only a single warning to show, print a simple message easy to read.
+			group = list(self._accumulated_warnings.values())[0]
+			message2send = group.render()
+			if group.count > 1: # This means that the warning was "raised" multiple times. We have to inform this!
+				message2send += f'\n\nThis warning happened {group.count} times in the last {self._static_fields["warn_interval"]}.'
+		else: # This means that there are multiple warnings waiting to be sent.
+			message2send = f'Multiple warnings were accumulated in the last {self._static_fields["warn_interval"]}:'
+			for group in self._accumulated_warnings.values():
+				message2send += '\n----\n'
+				message2send += group.render()
+				if group.count > 1:
+					message2send += f'\nThis warning happened {group.count} times.'
+			if self._forgotten_warnings > 0:
+				message2send += f'\n----\n{self._forgotten_warnings} more warnings happened, but there were too many different ones to show them all.'
+		return _split_message(message2send, separator='\n----\n')
+
+class ThreadSafeTelegramReporter4Loops(SafeTelegramReporter4Loops):
+	"""The same as `SafeTelegramReporter4Loops` but `update`, `warn`,
+	`count`, `set_completed` and `report` can be called from many threads
+	at the same time, e.g. from the workers of a `ThreadPoolExecutor`:
+	
+	```
+	with reporter.report_loop(len(urls), 'Downloading'):
+		with ThreadPoolExecutor(32) as executor:
+			executor.map(download_and_update, urls) # Calls `reporter.update(1)`.
+	```
+	
+	Each thread counts in its own counter, without any lock, and the 
+	counters are added up when it is time to check the progress. If a
+	thread finds that another one is already checking, it does not wait
+	for it, so only one thread at a time sends the reports.
+	"""
+	def __init__(self, *args, **kwargs):
+		"""See `SafeTelegramReporter4Loops`."""
+		super().__init__(*args, **kwargs)
+		self._lock = threading.RLock() # Reentrant, because e.g. `count` calls `warn`.
+	
+	def _start(self):
+		self._thread_counters = threading.local()
+		self._counters = [] # All the counters of the threads that took part in this loop, `[count, calls_until_check]` each.
+		self._merged_count = 0 # What was already added to `self._count` from `self._counters`.
+		with self._lock:
+			super()._start()
+	
+	def _finish(self, exc_type, exc_value):
+		with self._lock:
+			self._merge_counters()
+			super()._finish(exc_type, exc_value)
+	
+	def _merge_counters(self):
+		total = sum(counter[0] for counter in list(self._counters))
+		self._count += total - self._merged_count
+		self._merged_count = total
+	
+	def _create_counter(self):
+		if self._now_reporting == False:
+			raise RuntimeError(f'This method must be called from inside a context, i.e. inside a `with` statement.')
+		counter = [0, self._stride]
+		self._counters.append(counter)
+		self._thread_counters.counter = counter
+		return counter
+	
+	def update(self, count:int=1):
+		"""See `SafeTelegramReporter4Loops.update`. This can be called
+		from any thread."""
+		try:
+			counter = self._thread_counters.counter
+		except AttributeError: # The first call from this thread in this loop, or we are not reporting any loop.
+			counter = self._create_counter()
+		counter[0] += count # Only this thread writes into its counter, so no lock is needed.
+		counter[1] -= 1
+		if counter[1] <= 0:
+			counter[1] = self._stride
+			if self._lock.acquire(blocking=False): # If another thread is already checking, don't wait for it.
+				try:
+					self._merge_counters()
+					self._check()
+				finally:
+					self._lock.release()
+	
+	def _force_check(self):
+		super()._force_check() # For `track`.
+		for counter in list(self._counters):
+			counter[1] = 0
+	
+	def _warn(self, message:str):
+		with self._lock:
+			super()._warn(message)
+	
+	def count(self, count):
+		"""See `SafeTelegramReporter4Loops.count`."""
+		with self._lock:
+			super().count(count)
+	
+	def set_completed(self):
+		"""See `SafeTelegramReporter4Loops.set_completed`."""
+		with self._lock:
+			self._merge_counters()
+			super().set_completed()
+	
+	def report(self):
+		"""See `SafeTelegramReporter4Loops.report`."""
+		with self._lock:
+			self._merge_counters()
+			super().report()